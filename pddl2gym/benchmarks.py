@@ -0,0 +1,557 @@
+from pddl2gym.simulator import PDDLProblemSimulator
+from pddl2gym.utils import parse_problem, parse_domain, to_tuple, to_atoms_dict, files_in_dir
+from pddl2gym import cache
+from collections import defaultdict
+import subprocess
+import tempfile
+import datetime
+import platform
+import argparse
+import random
+import gc
+import json
+import time
+import csv
+import sys
+import os
+
+
+TRACK1_PATH = os.path.join(os.path.dirname(__file__), "pddl/Blocks/Track1/Untyped")
+COLUMNS_PATH = os.path.join(os.path.dirname(__file__), "pddl/blocks_columns")
+DOMAIN_PATHS = {"blocks": TRACK1_PATH, "blocks_columns": COLUMNS_PATH}
+
+
+def random_walk_states(simulator, n_states, seed=0):
+    rng = random.Random(seed)
+    state = simulator.reset()
+    states = [state]
+    while len(states) < n_states:
+        actions = simulator.get_applicable_str_actions(state)
+        state = simulator.apply(state, rng.choice(actions))
+        states.append(state)
+    return states
+
+
+def random_walk_plan(simulator, n_steps, seed=0):
+    # Random applicable actions (as strings) from the initial state, to be replayed by other simulators
+    rng = random.Random(seed)
+    state, plan = simulator.reset(), []
+    for _ in range(n_steps):
+        plan.append(rng.choice(simulator.get_applicable_str_actions(state)))
+        state = simulator.apply(state, plan[-1])
+    return plan
+
+
+def scan_applicable_actions(simulator, state):
+    # Reference implementation: linear scan over all grounded operators
+    applicable_actions = defaultdict(list)
+    for (action, params), op in simulator.operators.items():
+        if op.applicable(state):
+            applicable_actions[action].append(params)
+    return applicable_actions
+
+
+def timeit(fn, inputs, repetitions=1):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for x in inputs:
+            fn(x)
+    return (time.perf_counter() - start) / (repetitions * len(inputs))
+
+
+def benchmark_grounding(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, repetitions=3):
+    # Best of repetitions: parsing, grounding with pyperplan, loading the grounding from the disk cache (in a temporary
+    # cache directory) and building the whole simulator (with the grounding cached)
+    results = {"instance": instance_file}
+    cache_dir = cache.CACHE_DIR
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for key, cache_dir_of_key in [("ground_s", ""), ("cached_ground_s", tmp_dir)]:
+                cache.CACHE_DIR = cache_dir_of_key  # restored below
+                cache.ground_cached(parse_problem(domain_file, instance_file, path))  # fills the cache
+                problems = [parse_problem(domain_file, instance_file, path) for _ in range(repetitions)]
+                results[key] = min(timeit(cache.ground_cached, [p]) for p in problems)
+            results["parse_s"] = min(timeit(lambda _: parse_problem(domain_file, instance_file, path), [None])
+                                     for _ in range(repetitions))
+            problems = [parse_problem(domain_file, instance_file, path) for _ in range(repetitions)]
+            results["simulator_s"] = min(timeit(PDDLProblemSimulator, [p]) for p in problems)
+    finally:
+        cache.CACHE_DIR = cache_dir
+    return results
+
+
+def benchmark_apply(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_steps=5000):
+    # Throughput of apply alone, replaying the same random walk with frozenset and int bitmask states
+    results = {"instance": instance_file}
+    plan = None
+    for compact_states in (False, True):
+        simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path), compact_states=compact_states)
+        if plan is None:
+            plan = random_walk_plan(simulator, n_steps)
+        keys = [simulator._get_operator_key(a) for a in plan]
+        state = simulator.reset()
+        start = time.perf_counter()
+        for key in keys:
+            state = simulator.apply(state, key)
+        key = "compact" if compact_states else "frozenset"
+        results[f"{key}_apply_per_sec"] = n_steps / (time.perf_counter() - start)
+    return results
+
+
+def _make_env(instance_file, domain_file, path, **kwargs):
+    # PDDLGridEnv with the representation of the domain (Blocks, or BlocksColumns for the blocks_columns instances)
+    from pddl2gym.env import PDDLGridEnv
+    if os.path.abspath(path) == os.path.abspath(COLUMNS_PATH):
+        from pddl2gym.blocks_columns import BlocksColumns as Representation
+    else:
+        from pddl2gym.blocks import Blocks as Representation
+    simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path))
+    return PDDLGridEnv(simulator, Representation(), fixed_init_state=True, **kwargs)
+
+
+def benchmark_env_step(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_steps=2000):
+    # PDDLGridEnv.step throughput with random reduced actions, with the default caches and with caching disabled
+    import numpy as np
+    results = {"instance": instance_file}
+    for key, render_cache_size in [("cached", 1024), ("uncached", 0)]:
+        env = _make_env(instance_file, domain_file, path, max_moves=100, render_cache_size=render_cache_size)
+        n_actions = env.representation.get_n_actions(env.simulator.problem)
+        actions = np.random.RandomState(0).randint(n_actions, size=n_steps)
+        env.reset()
+        start = time.perf_counter()
+        for a in actions:
+            _, _, done, _ = env.step(a)
+            if done:
+                env.reset()
+        results[f"{key}_steps_per_sec"] = n_steps / (time.perf_counter() - start)
+    return results
+
+
+def benchmark_render(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_states=200):
+    # Per-state cost of the grid state (representation) and of rendering it (gridenvs), without caches
+    env = _make_env(instance_file, domain_file, path, max_moves=100, render_cache_size=0)
+    problem = env.simulator.problem
+    states = [env.simulator.get_atoms(s) for s in random_walk_states(env.simulator, n_states)]
+    grid_states = [env.representation.get_gridstate(problem, atoms) for atoms in states]
+    return {"instance": instance_file,
+            "gridstate_us": timeit(lambda atoms: env.representation.get_gridstate(problem, atoms), states) * 1e6,
+            "render_us": timeit(env.render_gridstate, grid_states) * 1e6}
+
+
+def benchmark_applicable_actions(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_states=200):
+    simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path))
+    states = random_walk_states(simulator, n_states)
+    for s in states:
+        assert simulator.get_applicable_actions(s) == scan_applicable_actions(simulator, s)
+
+    scan = timeit(lambda s: scan_applicable_actions(simulator, s), states)
+    indexed = timeit(simulator.get_applicable_actions, states)
+    return {"instance": instance_file,
+            "n_operators": len(simulator.operators),
+            "scan_us": scan * 1e6,
+            "indexed_us": indexed * 1e6,
+            "speedup": scan / indexed}
+
+
+def state_size(state):
+    if isinstance(state, int):
+        return sys.getsizeof(state)
+    return sys.getsizeof(state) + sum(sys.getsizeof(a) for a in state)
+
+
+def benchmark_compact_states(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_steps=2000):
+    # Replays the same random walk with frozenset and int bitmask states: apply + goal test + applicable actions
+    results = {"instance": instance_file}
+    plan = None
+    for compact_states in (False, True):
+        simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path), compact_states=compact_states)
+        if plan is None:
+            rng = random.Random(0)
+            state, plan = simulator.reset(), []
+            for _ in range(n_steps):
+                plan.append(rng.choice(simulator.get_applicable_str_actions(state)))
+                state = simulator.apply(state, plan[-1])
+
+        state = simulator.reset()
+        start = time.perf_counter()
+        for action in plan:
+            state = simulator.apply(state, action)
+            simulator.goal_reached(state)
+            simulator.get_applicable_actions(state)
+        key = "compact" if compact_states else "frozenset"
+        results[f"{key}_step_us"] = (time.perf_counter() - start) / n_steps * 1e6
+        results[f"{key}_state_bytes"] = state_size(state)
+    return results
+
+
+def benchmark_atom_table(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_states=500):
+    # Per-state cost of parsing all the atoms of a state: splitting strings against interned lookups
+    simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path))
+    states = random_walk_states(simulator, n_states)
+    table = simulator.atom_table
+    return {"instance": instance_file,
+            "to_tuple_us": timeit(lambda s: [to_tuple(a) for a in s], states) * 1e6,
+            "atom_table_us": timeit(lambda s: [table.parse(a) for a in s], states) * 1e6,
+            "to_atoms_dict_us": timeit(to_atoms_dict, states) * 1e6,
+            "to_atoms_dict_table_us": timeit(lambda s: to_atoms_dict(s, table), states) * 1e6}
+
+
+def benchmark_batch_env(n_blocks=7, fixed_n_actions=8, n_envs=256, n_steps=20):
+    # Steps/sec of PDDLBatchEnv against a loop over n_envs single PDDLGridEnvs, on random column problems
+    import numpy as np
+    from pddl2gym.env import PDDLGridEnv, PDDLBatchEnv
+    from pddl2gym.simulator import PDDLDomainSimulator
+    from pddl2gym.blocks import Blocks, get_random_column_problem_generator
+
+    def make_simulator():
+        domain = parse_domain("domain.pddl", TRACK1_PATH)
+        return PDDLDomainSimulator(domain, get_random_column_problem_generator(domain, n_blocks))
+
+    rng = np.random.RandomState(0)
+    actions = rng.randint(fixed_n_actions, size=(n_steps, n_envs))
+
+    # The garbage collector is disabled while timing (as in the timeit module): with hundreds of grounded
+    # simulators alive, its pauses otherwise dominate the timings
+    envs = [PDDLGridEnv(make_simulator(), Blocks(fixed_n_actions), fixed_init_state=False, max_moves=100)
+            for _ in range(n_envs)]
+    for env in envs:
+        env.reset()
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for t in range(n_steps):
+            for env, a in zip(envs, actions[t]):
+                _, _, done, _ = env.step(a)
+                if done:
+                    env.reset()
+        single = n_steps * n_envs / (time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    batch_env = PDDLBatchEnv(make_simulator(), Blocks(fixed_n_actions), n_envs, max_moves=100, fixed_init_state=False)
+    batch_env.reset()
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for t in range(n_steps):
+            batch_env.step(actions[t])
+        batched = n_steps * n_envs / (time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    return {"n_blocks": n_blocks,
+            "n_envs": n_envs,
+            "single_steps_per_sec": single,
+            "batch_steps_per_sec": batched,
+            "speedup": batched / single}
+
+
+def benchmark_registration(repetitions=10):
+    # Startup cost of pddl2gym.blocks, best of repetitions fresh interpreters:
+    #   import_s: the whole import, including its dependencies (gym, numpy, gridenvs, pyperplan)
+    #   own_import_s: the import once the dependencies are loaded, i.e. the cost of pddl2gym itself
+    #   own_import_before_s: the same, as it was before the manifest and the lazy import of pddl2gym.tabular: env specs
+    #   built by walking the problem directories, and pddl2gym.tabular and pddl2gym.search imported
+    # and the cost of the env specs alone: walking the problem directories against reading the manifest
+    from pddl2gym import blocks, utils
+    dependencies = "import gym, numpy, gridenvs.env, gridenvs.world, pyperplan.grounding, pddl2gym.utils"
+    without_manifest = "pddl2gym.utils._read_manifest = lambda: {}"
+
+    def import_time(setup="", modules="pddl2gym.blocks"):
+        cmd = f"{setup}\nimport time\nt = time.perf_counter()\nimport {modules}\nprint(time.perf_counter() - t)"
+        return min(float(subprocess.check_output([sys.executable, "-c", cmd]).split()[-1]) for _ in range(repetitions))
+
+    def read_manifest():
+        utils._read_manifest.cache_clear()
+        utils.load_manifest(blocks.__name__)
+
+    return {"import_s": import_time(),
+            "own_import_s": import_time(dependencies),
+            "own_import_before_s": import_time(f"{dependencies}\n{without_manifest}",
+                                               "pddl2gym.tabular, pddl2gym.search, pddl2gym.blocks"),
+            "walk_specs_s": timeit(lambda _: blocks.get_env_specs(), [None], repetitions),
+            "manifest_specs_s": timeit(lambda _: read_manifest(), [None], repetitions)}
+
+
+def benchmark_worker_pool(worker_counts=(1, 2, 4, 8), n_steps=2000, instances=None):
+    # Transitions/sec collected by RolloutWorkerPool on Track1 instances, for an increasing number of workers
+    from pddl2gym.workers import RolloutWorkerPool
+    if instances is None:
+        instances = sorted(f for f in os.listdir(TRACK1_PATH) if f.startswith("probBLOCKS"))
+    simulators = [PDDLProblemSimulator(parse_problem("domain.pddl", f, TRACK1_PATH), compact_states=True)
+                  for f in instances]
+
+    results = []
+    for n_workers in worker_counts:
+        with RolloutWorkerPool(simulators, n_workers=n_workers, n_steps=n_steps) as pool:
+            pool.collect()  # warm up
+            start = time.perf_counter()
+            pool.collect()
+            elapsed = time.perf_counter() - start
+        results.append({"n_workers": n_workers, "transitions_per_sec": n_workers * n_steps / elapsed})
+    return results
+
+
+def benchmark_pruning(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_states=200):
+    # Operator/fact counts before and after pruning, pruning time and applicable actions time with and without it
+    simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path))
+    start = time.perf_counter()
+    pruned = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path), prune="reachability")
+    elapsed = time.perf_counter() - start
+    states = random_walk_states(simulator, n_states)
+    return dict(pruned.pruning_stats,
+                instance=instance_file,
+                prune_s=elapsed,
+                applicable_us=timeit(simulator.get_applicable_actions, states) * 1e6,
+                pruned_applicable_us=timeit(pruned.get_applicable_actions, states) * 1e6)
+
+
+def benchmark_novelty(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_states=2000):
+    # Per-state cost of a width 2 novelty test + update: NoveltyTable against sets of atom strings and pairs
+    from pddl2gym.novelty import NoveltyTable
+    from itertools import combinations
+    simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path), compact_states=True)
+    states = random_walk_states(simulator, n_states)
+
+    seen = set()
+    def string_novelty(state):
+        atoms = simulator.get_atoms(state)
+        pairs = list(combinations(sorted(atoms), 2))
+        novelty = 1 if any(a not in seen for a in atoms) else 2 if any(p not in seen for p in pairs) else 3
+        seen.update(atoms)
+        seen.update(pairs)
+        return novelty
+
+    table = NoveltyTable(simulator, width=2)
+    return {"instance": instance_file,
+            "strings_us": timeit(string_novelty, states) * 1e6,
+            "table_us": timeit(table.novelty, states) * 1e6}
+
+
+def benchmark_generic_tensor(instance_file, domain_file="domain.pddl", path=TRACK1_PATH, n_states=2000):
+    # Per-state cost of the domain-agnostic tensor encoding, from atoms and from compact states
+    from pddl2gym.generic import GenericRepresentation
+    import numpy as np
+    problem = parse_problem(domain_file, instance_file, path)
+    simulator = PDDLProblemSimulator(problem, compact_states=True)
+    representation = GenericRepresentation(problem.domain)
+    states = random_walk_states(simulator, n_states)
+    atoms = [simulator.get_atoms(s) for s in states]
+    out = np.zeros(representation.get_tensor_shape(problem), dtype=np.uint8)
+    return {"instance": instance_file,
+            "tensor_size": len(out),
+            "atoms_us": timeit(lambda a: representation.get_tensor(problem, a, out=out), atoms) * 1e6,
+            "compact_us": timeit(lambda s: representation.get_tensor(problem, s, out=out), states) * 1e6}
+
+
+def benchmark_search(instance_file, domain_file="domain.pddl", path=TRACK1_PATH):
+    # Expanded nodes/sec of the built-in searches
+    from pddl2gym.search import breadth_first_search, astar_search
+    simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path), compact_states=True)
+    results = {"instance": instance_file}
+    for name, search in [("bfs", breadth_first_search), ("astar", astar_search)]:
+        plan, stats = search(simulator)
+        results[f"{name}_plan_length"] = len(plan)
+        results[f"{name}_expanded"] = stats["expanded"]
+        results[f"{name}_nodes_per_sec"] = stats["nodes_per_sec"]
+    return results
+
+
+def benchmark_reset_latency(n_blocks_range=range(2, 11), prefetch=4, n_resets=50, episode_s=0.01):
+    # Reset latency of PDDLDomainSimulator on random column problems: grounding every problem, with prefetching and
+    # with reuse of the grounded operators; and on uniformly random problems sampled as encoded states (see
+    # pddl2gym.random_blocks). episode_s of sleep between resets stands for the time spent in the episode outside the
+    # simulator (e.g. policy inference).
+    from pddl2gym.simulator import PDDLDomainSimulator
+    from pddl2gym.blocks import get_random_column_problem_generator
+    from pddl2gym.random_blocks import get_random_blocks_generator
+
+    configs = {"ground": {}, f"prefetch{prefetch}": {"prefetch": prefetch}, "reuse": {"reuse_grounding": True},
+               "sampled": {}}
+    results = []
+    for n_blocks in n_blocks_range:
+        result = {"n_blocks": n_blocks}
+        for name, kwargs in configs.items():
+            domain = parse_domain("domain.pddl", TRACK1_PATH)
+            if name == "sampled":
+                problem_generator = get_random_blocks_generator(domain, n_blocks, seed=0)
+            else:
+                problem_generator = get_random_column_problem_generator(domain, n_blocks)
+            simulator = PDDLDomainSimulator(domain, problem_generator, **kwargs)
+            latencies = []
+            for _ in range(n_resets):
+                time.sleep(episode_s)
+                start = time.perf_counter()
+                simulator.reset()
+                latencies.append(time.perf_counter() - start)
+            result[f"{name}_mean_ms"] = sum(latencies) / n_resets * 1e3
+            result[f"{name}_max_ms"] = max(latencies) * 1e3
+        results.append(result)
+    return results
+
+
+# Benchmarks run on every selected instance: name -> (function, max #blocks or None, domains)
+INSTANCE_BENCHMARKS = {"grounding": (benchmark_grounding, None, ("blocks", "blocks_columns")),
+                       "applicable_actions": (benchmark_applicable_actions, None, ("blocks", "blocks_columns")),
+                       "apply": (benchmark_apply, None, ("blocks", "blocks_columns")),
+                       "compact_states": (benchmark_compact_states, None, ("blocks", "blocks_columns")),
+                       "atom_table": (benchmark_atom_table, None, ("blocks", "blocks_columns")),
+                       "pruning": (benchmark_pruning, None, ("blocks", "blocks_columns")),
+                       # env_step and render are Blocks only: BlocksColumns.get_gridstate fails on every instance
+                       "env_step": (benchmark_env_step, None, ("blocks",)),
+                       "render": (benchmark_render, None, ("blocks",)),
+                       "novelty": (benchmark_novelty, None, ("blocks", "blocks_columns")),
+                       "generic_tensor": (benchmark_generic_tensor, None, ("blocks", "blocks_columns")),
+                       "search": (benchmark_search, 6, ("blocks",))}
+
+# Benchmarks that are run once, returning a dict or a list of dicts
+GLOBAL_BENCHMARKS = {"batch_env": benchmark_batch_env,
+                     "registration": benchmark_registration,
+                     "reset_latency": benchmark_reset_latency,
+                     "worker_pool": benchmark_worker_pool}
+
+DEFAULT_BENCHMARKS = ("grounding", "applicable_actions", "apply", "env_step", "render")
+
+
+def get_n_blocks(instance_file):
+    # probBLOCKS-<n>-<i>.pddl, target-<n>-<i>.pddl, instance_<n>_<goal>.pddl
+    return int(instance_file.replace("_", "-").split("-")[1])
+
+
+def get_instances(domains=("blocks", "blocks_columns"), min_blocks=None, max_blocks=None):
+    # (domain, path, instance file, #blocks) of the shipped instances, sorted by domain and number of blocks
+    instances = []
+    for domain in domains:
+        path = DOMAIN_PATHS[domain]
+        for f in files_in_dir(path):
+            if f.endswith(".pddl") and f != "domain.pddl":
+                n_blocks = get_n_blocks(f)
+                if (min_blocks is None or n_blocks >= min_blocks) and (max_blocks is None or n_blocks <= max_blocks):
+                    instances.append((domain, path, f, n_blocks))
+    return sorted(instances, key=lambda x: (x[0], x[3], x[2]))
+
+
+def get_metadata():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": datetime.datetime.now().isoformat(timespec="seconds")}
+
+
+def run_suite(benchmarks=DEFAULT_BENCHMARKS, domains=("blocks", "blocks_columns"), min_blocks=None, max_blocks=None,
+              verbose=False):
+    # Returns one row (flat dict) per benchmark and instance, with the benchmark name, domain and #blocks
+    rows = []
+    instances = get_instances(domains, min_blocks, max_blocks)
+    for name in benchmarks:
+        if name in GLOBAL_BENCHMARKS:
+            results = GLOBAL_BENCHMARKS[name]()
+            for result in (results if isinstance(results, list) else [results]):
+                rows.append(dict({"benchmark": name}, **result))
+                if verbose:
+                    print(rows[-1])
+            continue
+
+        fn, benchmark_max_blocks, benchmark_domains = INSTANCE_BENCHMARKS[name]
+        for domain, path, instance_file, n_blocks in instances:
+            if domain not in benchmark_domains or (benchmark_max_blocks is not None and n_blocks > benchmark_max_blocks):
+                continue
+            result = fn(instance_file, path=path)
+            rows.append(dict({"benchmark": name, "domain": domain, "n_blocks": n_blocks}, **result))
+            if verbose:
+                print(rows[-1])
+    return rows
+
+
+def write_results(rows, output, metadata=None):
+    # JSON ({"metadata": ..., "results": rows}) or CSV (one line per row, metadata in every line), by file extension
+    metadata = metadata or get_metadata()
+    if output.endswith(".csv"):
+        fields = list(metadata)
+        for row in rows:
+            fields.extend(k for k in row if k not in fields)
+        with open(output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(metadata, **row))
+    else:
+        with open(output, "w") as f:
+            json.dump({"metadata": metadata, "results": rows}, f, indent=1)
+
+
+def load_results(path):
+    # Rows of a JSON or CSV results file (CSV values are read back as numbers where possible)
+    if path.endswith(".csv"):
+        def parse(v):
+            try:
+                return float(v)
+            except ValueError:
+                return v
+        with open(path, newline="") as f:
+            return [{k: parse(v) for k, v in row.items() if v != ""} for row in csv.DictReader(f)]
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare_results(baseline_rows, rows, threshold=0.2):
+    # Metrics that got worse by more than threshold (relative) with respect to the baseline, matching rows by
+    # benchmark and instance. Times (*_s, *_ms, *_us) are better when lower, throughputs (*_per_sec) when higher.
+    def key(row):
+        return row["benchmark"], row.get("domain"), row.get("instance"), row.get("n_blocks"), row.get("n_workers")
+
+    baseline = {key(row): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        old = baseline.get(key(row))
+        if old is None:
+            continue
+        for metric, value in row.items():
+            old_value = old.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old_value, (int, float)) or old_value <= 0:
+                continue
+            if metric.endswith(("_s", "_ms", "_us")):
+                change = value / old_value - 1
+            elif metric.endswith("_per_sec"):
+                change = old_value / value - 1 if value > 0 else float("inf")
+            else:
+                continue
+            if change > threshold:
+                regressions.append({"benchmark": row["benchmark"], "instance": row.get("instance"), "metric": metric,
+                                    "baseline": old_value, "value": value, "slowdown": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pddl2gym performance benchmarks")
+    parser.add_argument("--benchmarks", nargs="+", default=list(DEFAULT_BENCHMARKS),
+                        choices=list(INSTANCE_BENCHMARKS) + list(GLOBAL_BENCHMARKS))
+    parser.add_argument("--domains", nargs="+", default=list(DOMAIN_PATHS), choices=list(DOMAIN_PATHS))
+    parser.add_argument("--min-blocks", type=int, default=None)
+    parser.add_argument("--max-blocks", type=int, default=None)
+    parser.add_argument("--output", default=None, help="results file, .json or .csv")
+    parser.add_argument("--baseline", default=None, help="previous results file (.json or .csv) to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as regression")
+    args = parser.parse_args(argv)
+
+    rows = run_suite(args.benchmarks, args.domains, args.min_blocks, args.max_blocks, verbose=True)
+    if args.output is not None:
+        write_results(rows, args.output)
+    if args.baseline is not None:
+        regressions = compare_results(load_results(args.baseline), rows, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['benchmark']} {r['instance']} {r['metric']}: {r['baseline']:.4g} -> {r['value']:.4g} "
+                  f"(+{r['slowdown']:.0%})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
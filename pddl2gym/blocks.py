@@ -1,12 +1,24 @@
 from gridenvs.world import GridObject
 from pddl2gym.env import PDDLRepresentation, PDDLGridEnv
-from pddl2gym.simulator import PDDLProblemSimulator, PDDLDomainSimulator
-from pddl2gym.utils import to_tuple, to_string, to_atoms_dict, get_atom_fixed_param, files_in_dir, parse_problem, parse_domain, get_objects_by_type
+from pddl2gym.simulator import PDDLProblemSimulator, PDDLDomainSimulator, get_problem_simulator
+from pddl2gym.utils import to_string, files_in_dir, parse_problem, parse_domain, get_objects_by_type, register_env_specs, load_manifest
 from collections import defaultdict
+import numpy as np
 import gym
 import os
 
 
+class BlocksStructure:
+    # Structured view of a Blocks state: towers (ordered bottom to top) indexed by their bottom block, the bottom block
+    # of the tower of each block that is not held, and the held block (None if the hand is empty)
+    __slots__ = ("towers", "bottom", "holding")
+
+    def __init__(self, towers, bottom, holding):
+        self.towers = towers
+        self.bottom = bottom
+        self.holding = holding
+
+
 class Blocks(PDDLRepresentation):
     def __init__(self, fixed_n_actions=None):
         self.fixed_n_actions = fixed_n_actions
@@ -17,15 +29,56 @@ class Blocks(PDDLRepresentation):
             return self.fixed_n_actions
         return len(problem.objects_by_type["object"])
 
+    def get_structure(self, problem, atoms):
+        ontable, on, holding_block = self._read_atoms(problem, atoms)
+        towers = {}
+        bottom = {}
+        for b in problem.objects_by_type["object"]:
+            if ontable[b]:
+                tower = []
+                top = b
+                while top is not None:
+                    tower.append(top)
+                    bottom[top] = b
+                    top = on[top]
+                towers[b] = tuple(tower)
+        return BlocksStructure(towers, bottom, holding_block)
+
+    def update_structure(self, problem, structure, atoms, operator):
+        # Only the tower the block is taken from / put on changes
+        towers = dict(structure.towers)
+        bottom = dict(structure.bottom)
+        holding = structure.holding
+        for a in operator.add_effects:
+            name, params = problem.atom_table.parse(a)
+            if name == "holding":  # pick-up / unstack
+                holding = params[0]
+                b = bottom.pop(holding)
+                if b == holding:
+                    del towers[b]
+                else:
+                    towers[b] = towers[b][:-1]
+            elif name == "ontable":  # put-down
+                towers[params[0]] = (params[0],)
+                bottom[params[0]] = params[0]
+                holding = None
+            elif name == "on":  # stack
+                b = bottom[params[1]]
+                towers[b] = towers[b] + (params[0],)
+                bottom[params[0]] = b
+                holding = None
+        return BlocksStructure(towers, bottom, holding)
+
     def get_reduced_actions(self, problem, atoms):
-        atoms_dict = to_atoms_dict(atoms)
+        # atoms can also be a BlocksStructure, which avoids parsing them
+        structure = atoms if isinstance(atoms, BlocksStructure) else self.get_structure(problem, atoms)
+        hb = structure.holding
 
         # one action per column
         actions = [None]*self.get_n_actions(problem)
         for i, b in enumerate(problem.objects_by_type["object"]):
-            bp = self._get_block_pile(atoms_dict, b)
-            if "holding" in atoms_dict:
-                hb = atoms_dict["holding"][0][0]
+            bp = structure.towers.get(b, ())
+            if hb is not None:
                 if len(bp) == 0:
                     if hb == b:
                         actions[i] = ("put-down", (hb,))  # empty column
@@ -34,7 +87,6 @@ class Blocks(PDDLRepresentation):
                 else:
                     actions[i] = ("stack", (hb, bp[-1])) # column has at least one block, stack on top one
             else:
-                assert "handempty" in atoms_dict
                 if len(bp) == 0:
                     actions[i] = None  # empty column, we cannot pick any block from there
                 elif len(bp) == 1:
@@ -44,24 +96,12 @@ class Blocks(PDDLRepresentation):
 
         return actions
 
-    def _get_block_pile(self, atoms_dict, b):  #ordered bottom to top
-        blocks = []
-        if "ontable" in atoms_dict and (b,) in atoms_dict["ontable"]:
-            blocks.append(b)
-
-            while True:
-                params = get_atom_fixed_param(atoms_dict, name="on", param_idx=1, param_value=blocks[-1])
-                if params is None:
-                    break
-                blocks.append(params[0])
-        return blocks
-
-    def _read_atoms(self, atoms):
+    def _read_atoms(self, problem, atoms):
         ontable = defaultdict(bool)
         on = dict()  # on[y] = x <-> on x y
         holding_block = None
         for a in atoms:
-            name, signature = to_tuple(a)
+            name, signature = problem.atom_table.parse(a)
             if name == "on":
                 b_top, b_bottom = signature
                 on[b_bottom] = b_top
@@ -77,40 +117,77 @@ class Blocks(PDDLRepresentation):
                 assert holding_block is None
         return ontable, on, holding_block
 
-    def get_gridstate(self, problem, atoms):
-        ontable, on, holding_block = self._read_atoms(atoms)
-        blocks = problem.objects_by_type["object"]
-        block_colors = {b: c for b, c in zip(blocks, self.colors)}
-
-        gridsize = (len(blocks) + 1, len(blocks) + 1)
+    def _get_gridsize(self, problem):
+        n_blocks = len(problem.objects_by_type["object"])
+        gridsize = (n_blocks + 1, n_blocks + 1)
         if self.fixed_n_actions is not None:
             assert self.fixed_n_actions >= gridsize[0] and self.fixed_n_actions >= gridsize[1]
             gridsize = self.fixed_n_actions + 1, self.fixed_n_actions + 1
+        return gridsize
+
+    def get_gridstate(self, problem, atoms):
+        # atoms can also be a BlocksStructure, which avoids parsing them
+        structure = atoms if isinstance(atoms, BlocksStructure) else self.get_structure(problem, atoms)
+        blocks = problem.objects_by_type["object"]
+        block_colors = {b: c for b, c in zip(blocks, self.colors)}
+        gridsize = self._get_gridsize(problem)
 
         objects = []
         for i, block in enumerate(blocks):
-            if ontable[block]:
-                j = 0
-                b = block
-                while b is not None:
-                    objects.append(GridObject(name=b,
-                                              pos=(i, gridsize[1]-j-1),
-                                              rgb=block_colors[b]))
-                    b = on[b]
-                    j += 1
-            else:
-                assert block in on.values() or block == holding_block
+            for j, b in enumerate(structure.towers.get(block, ())):
+                objects.append(GridObject(name=b,
+                                          pos=(i, gridsize[1]-j-1),
+                                          rgb=block_colors[b]))
 
-        if holding_block is not None:
-            objects.append(GridObject(name=holding_block,
+        if structure.holding is not None:
+            objects.append(GridObject(name=structure.holding,
                                       pos=(gridsize[0] - 1, 0),
-                                      rgb=block_colors[holding_block]))
+                                      rgb=block_colors[structure.holding]))
 
         return gridsize, objects
 
+    def get_tensor_shape(self, problem, one_hot=False):
+        width, height = self._get_gridsize(problem)
+        if one_hot:
+            return width*height, len(problem.objects_by_type["object"])
+        return height, width
+
+    def get_tensor(self, problem, atoms, out=None, one_hot=False):
+        # Same layout as get_gridstate, as a (height x width) grid with the id of the block at each cell (its index in
+        # objects_by_type["object"] plus one, 0 if empty), or one-hot as (cell x block), cells in row-major order.
+        # If given, out (e.g. a row of a batch) is overwritten instead of allocating a new array.
+        structure = atoms if isinstance(atoms, BlocksStructure) else self.get_structure(problem, atoms)
+        if out is None:
+            out = np.zeros(self.get_tensor_shape(problem, one_hot), dtype=np.uint8)
+        else:
+            out.fill(0)
+        block_ids = self._get_block_ids(problem)
+        width, height = self._get_gridsize(problem)
+
+        for i, block in enumerate(problem.objects_by_type["object"]):
+            for j, b in enumerate(structure.towers.get(block, ())):
+                y = height - j - 1
+                if one_hot:
+                    out[y*width + i, block_ids[b]] = 1
+                else:
+                    out[y, i] = block_ids[b] + 1
+
+        if structure.holding is not None:
+            if one_hot:
+                out[width - 1, block_ids[structure.holding]] = 1
+            else:
+                out[0, width - 1] = block_ids[structure.holding] + 1
+        return out
+
+    def _get_block_ids(self, problem):
+        if getattr(self, "_block_ids_problem", None) is not problem:
+            self._block_ids_problem = problem
+            self._block_ids = {b: i for i, b in enumerate(problem.objects_by_type["object"])}
+        return self._block_ids
+
     def get_atoms_from_subset(self, problem, atoms):
         # We asume that, if not stated otherwise, all blocks are on the table and clear, and the hand is empty
-        ontable, on, holding_block = self._read_atoms(atoms)
+        ontable, on, holding_block = self._read_atoms(problem, atoms)
 
         deduced_atoms = []
         blocks = problem.objects_by_type["object"]
@@ -161,27 +238,38 @@ def get_random_column_problem_generator(domain, n_blocks):
         yield random_column_problem()
 
 
-def blocks(max_moves, fixed_n_actions, domain_file, instance_file, path=None):
+def _get_env_class(tabular):
+    if tabular:
+        # Imported on use: pddl2gym.tabular (and pddl2gym.search) are not needed to register the environments
+        from pddl2gym.tabular import TabularPDDLGridEnv
+        return TabularPDDLGridEnv
+    return PDDLGridEnv
+
+
+def blocks(max_moves, fixed_n_actions, domain_file, instance_file, path=None, tabular=False):
+    # With tabular=True, the reachable state space is precomputed (see pddl2gym.tabular); only for small instances
     simulator = PDDLProblemSimulator(parse_problem(domain_file, instance_file, path))
-    return PDDLGridEnv(simulator=simulator,
-                       representation=Blocks(fixed_n_actions=fixed_n_actions),
-                       fixed_init_state=True,
-                       max_moves=max_moves)
+    env_class = _get_env_class(tabular)
+    return env_class(simulator=simulator,
+                     representation=Blocks(fixed_n_actions=fixed_n_actions),
+                     fixed_init_state=True,
+                     max_moves=max_moves)
 
 
 
-def register_track1(fixed_n_actions=None):
-    # If fixed_n_actions is not None, all environments with #blocks < fixed_n_actions will be registered
-    registered_envs = {}
+def track1_env_specs(fixed_n_actions=None):
+    # If fixed_n_actions is not None, all environments with #blocks < fixed_n_actions will be included
+    # Paths are relative to the package directory (see utils.register_env_specs)
+    specs = {}
     for p in ["pddl/Blocks/Track1/Untyped", "pddl/Blocks/Track1/Untyped/Additional"]:
         path = os.path.join(os.path.dirname(__file__), p)
-        domain_path = os.path.join(path, "domain.pddl")
+        domain_path = os.path.join(p, "domain.pddl")
         for problem_file in sorted(files_in_dir(path)):
             if problem_file.endswith(".pddl") and problem_file != "domain.pddl":
                 assert problem_file.startswith("probBLOCKS") or problem_file.startswith("probblocks"),\
                     f"Environment id not specified for problem file {problem_file}"
 
-                instance_path = os.path.join(path, problem_file)
+                instance_path = os.path.join(p, problem_file)
                 _, i, j = problem_file.split(".")[0].split("-")  # output example: ['probBLOCKS', '4', '0']
 
                 if fixed_n_actions is None:
@@ -191,57 +279,51 @@ def register_track1(fixed_n_actions=None):
                     if int(i) > fixed_n_actions:  # Only register envs with a valid grid size
                         continue
 
-                try:
-                    gym.register(id=env_id,
-                                 entry_point='pddl2gym.blocks:blocks',
-                                 nondeterministic=False,
-                                 kwargs={'max_moves': 100,
-                                         'fixed_n_actions': fixed_n_actions,
-                                         'domain_file': domain_path,
-                                         'instance_file': instance_path
-                                         }
-                                 )
-                    registered_envs[env_id] = (domain_path, instance_path)
-                except gym.error.Error:
-                    pass
+                specs[env_id] = {"entry_point": 'pddl2gym.blocks:blocks',
+                                 "kwargs": {'max_moves': 100,
+                                            'fixed_n_actions': fixed_n_actions,
+                                            'domain_file': domain_path,
+                                            'instance_file': instance_path}}
+    return specs
+
 
-    return registered_envs
+def register_track1(fixed_n_actions=None):
+    return register_env_specs(track1_env_specs(fixed_n_actions))
 
 
 def blocks_random_column(n_blocks, max_moves, fixed_n_actions, domain_file, path=None):
+    # No tabular mode (see pddl2gym.tabular): every episode is a new problem, while tabular models are per problem
     domain = parse_domain(domain_file, path)
     problem_generator = get_random_column_problem_generator(domain, n_blocks=n_blocks)
     simulator = PDDLDomainSimulator(domain=domain,
-                                    problem_generator=problem_generator)
+                                    problem_generator=problem_generator,
+                                    reuse_grounding=True)
     return PDDLGridEnv(simulator=simulator, representation=Blocks(fixed_n_actions=fixed_n_actions), fixed_init_state=False, max_moves=max_moves)
 
 
-def register_blocks_random_column(fixed_n_actions=None):
-    registered_envs = {}
+def blocks_random_column_env_specs(fixed_n_actions=None):
+    specs = {}
     for i in range(2, 11):
-        try:
-            if fixed_n_actions is None:
-                env_id = f"PDDL_Blocks_RandomColumn{i}-v0"
-            else:
-                env_id = f"PDDL_Blocks{fixed_n_actions}_RandomColumn{i}-v0"
-                if int(i) > fixed_n_actions:  # Only register envs with a valid grid size
-                    continue
+        if fixed_n_actions is None:
+            env_id = f"PDDL_Blocks_RandomColumn{i}-v0"
+        else:
+            env_id = f"PDDL_Blocks{fixed_n_actions}_RandomColumn{i}-v0"
+            if int(i) > fixed_n_actions:  # Only register envs with a valid grid size
+                continue
+
+        specs[env_id] = {"entry_point": 'pddl2gym.blocks:blocks_random_column',
+                         "kwargs": {"n_blocks": i,
+                                    "domain_file": "pddl/Blocks/Track1/Untyped/domain.pddl",
+                                    "max_moves": 100,
+                                    "fixed_n_actions": fixed_n_actions}}
+    return specs
 
-            domain_path = os.path.join(os.path.dirname(__file__), "pddl/Blocks/Track1/Untyped/domain.pddl")
-            gym.register(id=env_id,
-                         entry_point='pddl2gym.blocks:blocks_random_column',
-                         nondeterministic=False,
-                         kwargs={"n_blocks": i,
-                                 "domain_file": domain_path,
-                                 "max_moves": 100,
-                                 "fixed_n_actions": fixed_n_actions})
-            registered_envs[env_id] = (domain_path, None)
-        except gym.error.Error:
-            pass
-    return registered_envs
-
-
-def blocks_fixed_column(n_blocks, column_idx, max_moves, fixed_n_actions, domain_file, path=None):
+
+def register_blocks_random_column(fixed_n_actions=None):
+    return register_env_specs(blocks_random_column_env_specs(fixed_n_actions))
+
+
+def blocks_fixed_column(n_blocks, column_idx, max_moves, fixed_n_actions, domain_file, path=None, tabular=False):
     from pyperplan.pddl.pddl import Problem, Predicate
 
     domain = parse_domain(domain_file, path)
@@ -273,46 +355,54 @@ def blocks_fixed_column(n_blocks, column_idx, max_moves, fixed_n_actions, domain
                       goal=goal)
     problem.objects_by_type = get_objects_by_type(problem)
 
-    simulator = PDDLProblemSimulator(problem)
-    return PDDLGridEnv(simulator=simulator,
-                       representation=Blocks(fixed_n_actions=fixed_n_actions),
-                       fixed_init_state=True,
-                       max_moves=max_moves)
+    simulator = get_problem_simulator(problem)
+    env_class = _get_env_class(tabular)
+    return env_class(simulator=simulator,
+                     representation=Blocks(fixed_n_actions=fixed_n_actions),
+                     fixed_init_state=True,
+                     max_moves=max_moves)
 
-def register_blocks_fixed_column(fixed_n_actions=None):
-    registered_envs = {}
+def blocks_fixed_column_env_specs(fixed_n_actions=None):
+    specs = {}
     for i in range(2, 11):
         for column_idx in range(i):
-            try:
-                if fixed_n_actions is None:
-                    env_id = f"PDDL_Blocks_FixedColumn{i}_{column_idx}-v0"
-                else:
-                    env_id = f"PDDL_Blocks{fixed_n_actions}_FixedColumn{i}_{column_idx}-v0"
-                    if int(i) > fixed_n_actions:  # Only register envs with a valid grid size
-                        continue
+            if fixed_n_actions is None:
+                env_id = f"PDDL_Blocks_FixedColumn{i}_{column_idx}-v0"
+            else:
+                env_id = f"PDDL_Blocks{fixed_n_actions}_FixedColumn{i}_{column_idx}-v0"
+                if int(i) > fixed_n_actions:  # Only register envs with a valid grid size
+                    continue
+
+            specs[env_id] = {"entry_point": 'pddl2gym.blocks:blocks_fixed_column',
+                             "kwargs": {"n_blocks": i,
+                                        "domain_file": "pddl/Blocks/Track1/Untyped/domain.pddl",
+                                        'column_idx': column_idx,
+                                        'fixed_n_actions': fixed_n_actions,
+                                        "max_moves": 100}}
+    return specs
+
+
+def register_blocks_fixed_column(fixed_n_actions=None):
+    return register_env_specs(blocks_fixed_column_env_specs(fixed_n_actions))
+
 
-                domain_path = os.path.join(os.path.dirname(__file__), "pddl/Blocks/Track1/Untyped/domain.pddl")
-                gym.register(id=env_id,
-                             entry_point='pddl2gym.blocks:blocks_fixed_column',
-                             nondeterministic=False,
-                             kwargs={"n_blocks": i,
-                                     "domain_file": domain_path,
-                                     'column_idx': column_idx,
-                                     'fixed_n_actions': fixed_n_actions,
-                                     "max_moves": 100})
-                registered_envs[env_id] = (domain_path, None)
-            except gym.error.Error:
-                pass
-    return registered_envs
+def get_env_specs():
+    # All environments of this module. They are registered from the generated manifest (see pddl2gym.manifest), so
+    # that importing the module does not walk the problem directories.
+    specs = track1_env_specs()
+    specs.update(track1_env_specs(8))
+    specs.update(blocks_fixed_column_env_specs())
+    specs.update(blocks_fixed_column_env_specs(8))
+    specs.update(blocks_random_column_env_specs())
+    specs.update(blocks_random_column_env_specs(8))
+    return specs
 
 
 # Register environments
-registered_envs = register_track1()
-registered_envs.update(register_track1(8))
-registered_envs.update(register_blocks_fixed_column())
-registered_envs.update(register_blocks_fixed_column(8))
-registered_envs.update(register_blocks_random_column())
-registered_envs.update(register_blocks_random_column(8))
+specs = load_manifest(__name__)
+if specs is None:  # manifest not generated yet (see pddl2gym.manifest)
+    specs = get_env_specs()
+registered_envs = register_env_specs(specs)
 
 
 if __name__ == "__main__":
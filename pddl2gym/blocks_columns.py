@@ -2,7 +2,8 @@ from gridenvs.world import GridObject
 from gridenvs.utils import Colors
 from pddl2gym.env import PDDLGridEnv, PDDLRepresentation
 from pddl2gym.simulator import PDDLProblemSimulator
-from pddl2gym.utils import to_tuple, to_atoms_dict, get_atom_fixed_param, files_in_dir, parse_problem
+from pddl2gym.utils import to_atoms_dict, get_atom_fixed_param, files_in_dir, parse_problem, register_env_specs, load_manifest
+import numpy as np
 import gym
 import os
 
@@ -12,7 +13,7 @@ class BlocksColumns(PDDLRepresentation):
         return len(problem.objects_by_type["column"])
 
     def get_reduced_actions(self, problem, atoms):
-        atoms_dict = to_atoms_dict(atoms)
+        atoms_dict = to_atoms_dict(atoms, problem.atom_table)
 
         # one action per column
         actions = []
@@ -67,11 +68,32 @@ class BlocksColumns(PDDLRepresentation):
         all_blocks = salients + blocks
         grid_size = (len(all_blocks), len(columns + 1))
 
+        on, col_bottom, holding_block = self._read_atoms(problem, atoms)
+
+        objects = []
+        for i, c in enumerate(columns):
+            j = 0
+            b = col_bottom[c]
+            while b is not None:
+                objects.append(GridObject(name=b,
+                                          pos=(i, grid_size[1] - j - 1),
+                                          rgb=block_colors[b]))
+                b = on[b]
+                j += 1
+
+        if holding_block is not None:
+            objects.append(GridObject(name=holding_block,
+                                      pos=(grid_size[0] - 1, 0),
+                                      rgb=block_colors[holding_block]))
+
+        return objects
+
+    def _read_atoms(self, problem, atoms):
         on = dict()
         col_bottom = dict()
         holding_block = None
         for a in atoms:
-            name, signature = to_tuple(a)
+            name, signature = problem.atom_table.parse(a)
 
             if name == "on":
                 b_top, b_bottom = signature
@@ -90,25 +112,93 @@ class BlocksColumns(PDDLRepresentation):
             elif name == "hand-free":
                 assert holding_block is None
 
-        assert len(col_bottom.keys()) == len(columns)
+        assert len(col_bottom.keys()) == len(problem.objects_by_type["column"])
+        return on, col_bottom, holding_block
+
+    def _get_all_blocks(self, problem):
+        return problem.objects_by_type.get("salient", []) + problem.objects_by_type["block"]
+
+    def get_tensor_shape(self, problem, one_hot=False):
+        # One column per PDDL column plus one for the hand, one row per block plus the row of the hand
+        width = len(problem.objects_by_type["column"]) + 1
+        height = len(self._get_all_blocks(problem)) + 1
+        if one_hot:
+            return width*height, len(self._get_all_blocks(problem))
+        return height, width
+
+    def get_tensor(self, problem, atoms, out=None, one_hot=False):
+        # (height x width) grid with the id of the block at each cell (its index in salients + blocks, plus one, 0 if
+        # empty), or one-hot as (cell x block), cells in row-major order. The held block is in the top-right cell.
+        # If given, out (e.g. a row of a batch) is overwritten instead of allocating a new array.
+        if out is None:
+            out = np.zeros(self.get_tensor_shape(problem, one_hot), dtype=np.uint8)
+        else:
+            out.fill(0)
+        fact_ids = self._get_fact_ids(problem)
+        n_columns = len(problem.objects_by_type["column"])
+        width = n_columns + 1
+        height = len(self._get_all_blocks(problem)) + 1
+
+        above = [-1] * (height - 1)  # above[b]: block on block b, -1 if none
+        col_bottom = [-1] * n_columns
+        holding_block = -1
+        for a in atoms:
+            ids = fact_ids.get(a)
+            if ids is None:
+                ids = self._add_fact_ids(problem, a)
+            name, x, y = ids
+            if name == "on":
+                above[y] = x
+            elif name == "bottom":
+                col_bottom[y] = x
+            elif name == "holding":
+                holding_block = x
 
-        objects = []
-        for i, c in enumerate(columns):
+        for i in range(n_columns):
             j = 0
-            b = col_bottom[c]
-            while b is not None:
-                objects.append(GridObject(name=b,
-                                          pos=(i, grid_size[1] - j - 1),
-                                          rgb=block_colors[b]))
-                b = on[b]
+            b = col_bottom[i]
+            while b >= 0:
+                y = height - j - 1
+                if one_hot:
+                    out[y*width + i, b] = 1
+                else:
+                    out[y, i] = b + 1
+                b = above[b]
                 j += 1
 
-        if holding_block is not None:
-            objects.append(GridObject(name=holding_block,
-                                      pos=(grid_size[0] - 1, 0),
-                                      rgb=block_colors[holding_block]))
-
-        return objects
+        if holding_block >= 0:
+            if one_hot:
+                out[width - 1, holding_block] = 1
+            else:
+                out[0, width - 1] = holding_block + 1
+        return out
+
+    def _get_fact_ids(self, problem):
+        # Fact -> (name, block id, block id or column index) of the on, bottom and holding facts of the atom table of
+        # problem, (None, -1, -1) for the other facts. Built once per problem, so get_tensor does not parse atoms.
+        if getattr(self, "_fact_ids_problem", None) is not problem:
+            self._fact_ids_problem = problem
+            self._object_ids = ({b: i for i, b in enumerate(self._get_all_blocks(problem))},
+                                {c: i for i, c in enumerate(problem.objects_by_type["column"])})
+            self._fact_ids = {}
+            for a in problem.atom_table.parsed:
+                self._add_fact_ids(problem, a)
+        return self._fact_ids
+
+    def _add_fact_ids(self, problem, atom):
+        # Also used for atoms that are not grounded facts (see AtomTable.parse)
+        block_ids, column_ids = self._object_ids
+        name, params = problem.atom_table.parse(atom)
+        if name == "on":
+            ids = (name, block_ids[params[0]], block_ids[params[1]])
+        elif name == "bottom":
+            ids = (name, block_ids[params[0]], column_ids[params[1]])
+        elif name == "holding":
+            ids = (name, block_ids[params[0]], -1)
+        else:
+            ids = (None, -1, -1)
+        self._fact_ids[atom] = ids
+        return ids
 
 
 def blocks_columns(domain_file, instance_file, path=None):
@@ -116,11 +206,12 @@ def blocks_columns(domain_file, instance_file, path=None):
     return PDDLGridEnv(simulator=simulator, representation=BlocksColumns(), fixed_init_state=True, max_moves=100)
 
 
-def register_envs():
-    registered_envs = {}
-    path = os.path.join(os.path.dirname(__file__), "pddl/blocks_columns")
-    domain_path = os.path.join(path, "domain.pddl")
-    for problem_file in sorted(files_in_dir(path)):
+def get_env_specs():
+    # Paths are relative to the package directory (see utils.register_env_specs)
+    specs = {}
+    p = "pddl/blocks_columns"
+    domain_path = os.path.join(p, "domain.pddl")
+    for problem_file in sorted(files_in_dir(os.path.join(os.path.dirname(__file__), p))):
         if problem_file.endswith(".pddl") and problem_file != "domain.pddl":
             if problem_file.startswith("probBLOCKS"):
                 _, i, j = problem_file.split(".")[0].split("-")  # output example: ['probBLOCKS', '4', '0']
@@ -134,21 +225,20 @@ def register_envs():
             else:
                 raise NotImplementedError(f"Environment id not specified for problem file {problem_file}")
 
-            try:
-                instance_path = os.path.join(path, problem_file)
-                gym.register(id=env_id,
-                             entry_point='pddl2gym.blocks_columns:blocks_columns',
-                             nondeterministic=False,
-                             kwargs={"domain_file": domain_path,
-                                     "instance_file": instance_path})
-                registered_envs[env_id] = (domain_path, instance_path)
-            except gym.error.Error:
-                pass
+            specs[env_id] = {"entry_point": 'pddl2gym.blocks_columns:blocks_columns',
+                             "kwargs": {"domain_file": domain_path,
+                                        "instance_file": os.path.join(p, problem_file)}}
+    return specs
 
-    return registered_envs
+
+def register_envs():
+    return register_env_specs(get_env_specs())
 
 
-registered_envs = register_envs()
+specs = load_manifest(__name__)
+if specs is None:  # manifest not generated yet (see pddl2gym.manifest)
+    specs = get_env_specs()
+registered_envs = register_env_specs(specs)
 
 
 if __name__ == "__main__":
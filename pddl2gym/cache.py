@@ -0,0 +1,109 @@
+from pyperplan.grounding import ground
+from pyperplan.task import Operator, Task
+import numpy as np
+import hashlib
+import tempfile
+import pickle
+import os
+
+
+# Directory for the on-disk caches (e.g. DEFAULT_CACHE_DIR). Caching is opt-in: it is disabled unless the directory is
+# given with the PDDL2GYM_CACHE_DIR environment variable or by setting pddl2gym.cache.CACHE_DIR.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pddl2gym")
+CACHE_DIR = os.environ.get("PDDL2GYM_CACHE_DIR", "")
+
+GROUNDING_FORMAT_VERSION = 2
+
+
+def file_hash(*files, extra=""):
+    h = hashlib.sha256(extra.encode())
+    for file in files:
+        with open(file, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def get_cache_path(kind, key, extension=".pkl"):
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, kind, f"{key}{extension}")
+
+
+def save_atomic(path, obj):
+    # Write to a temporary file and rename, so that concurrent workers never read a partially written file. The
+    # temporary file is unique per call, as threads of the same process may write the same path (e.g. prefetching).
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load(path):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def encode_task(task):
+    # Compact form of a grounded task: facts are stored once, and the preconditions, add and delete effects of all
+    # operators are concatenated into a single int32 array of fact ids, delimited by offsets
+    facts = sorted(task.facts)
+    fact_ids = {f: i for i, f in enumerate(facts)}
+
+    operator_facts, offsets = [], [0]
+    for op in task.operators:
+        for atoms in (op.preconditions, op.add_effects, op.del_effects):
+            operator_facts.extend(sorted(fact_ids[a] for a in atoms))
+            offsets.append(len(operator_facts))
+
+    return {"name": task.name,
+            "facts": facts,
+            "initial_state": np.array(sorted(fact_ids[a] for a in task.initial_state), dtype=np.int32),
+            "goals": np.array(sorted(fact_ids[a] for a in task.goals), dtype=np.int32),
+            "operator_names": [op.name for op in task.operators],
+            "operator_facts": np.array(operator_facts, dtype=np.int32),
+            "operator_offsets": np.array(offsets, dtype=np.int32)}
+
+
+def decode_task(data):
+    facts = data["facts"]
+    atoms = [facts[i] for i in data["operator_facts"].tolist()]
+    offsets = data["operator_offsets"].tolist()
+
+    operators = []
+    for i, name in enumerate(data["operator_names"]):
+        pre, add, delete = (atoms[offsets[j]:offsets[j+1]] for j in range(3*i, 3*i + 3))
+        operators.append(Operator(name, pre, add, delete))
+    initial_state = frozenset(facts[i] for i in data["initial_state"].tolist())
+    goals = frozenset(facts[i] for i in data["goals"].tolist())
+    return Task(data["name"], set(facts), initial_state, goals, operators)
+
+
+def ground_cached(problem, remove_irrelevant_operators=True):
+    # Grounds the problem, reusing a previous grounding from disk if the problem was parsed from files (see
+    # utils.parse_problem) with the same domain and problem contents.
+    files = getattr(problem, "pddl_files", None)
+    path = None
+    if files is not None:
+        extra = f"v{GROUNDING_FORMAT_VERSION} {remove_irrelevant_operators}"
+        path = get_cache_path("grounding", file_hash(*files, extra=extra))
+    if path is not None:
+        data = load(path)
+        if data is not None:
+            problem.objects.update(problem.domain.constants)  # as done by pyperplan's ground()
+            return decode_task(data)
+
+    task = ground(problem, remove_irrelevant_operators=remove_irrelevant_operators)
+    if path is not None:
+        try:
+            save_atomic(path, encode_task(task))
+        except OSError:
+            pass  # read-only or full cache directory, just do not cache
+    return task
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class StateEncoder:
+    # Assigns an integer id to every grounded fact, so that a state (set of facts) becomes a Python int bitmask
+    def __init__(self, facts):
+        self.facts = tuple(sorted(facts))
+        self.fact_ids = {f: i for i, f in enumerate(self.facts)}
+        self.n_facts = len(self.facts)
+        self.n_bytes = (self.n_facts + 7) // 8
+
+    def encode(self, atoms):
+        mask = 0
+        for a in atoms:
+            mask |= 1 << self.fact_ids[a]
+        return mask
+
+    def decode(self, state):
+        return frozenset(self.facts[i] for i in self.get_fact_ids(state))
+
+    def get_fact_ids(self, state):
+        ids = []
+        while state:
+            lowest_bit = state & -state
+            ids.append(lowest_bit.bit_length() - 1)
+            state ^= lowest_bit
+        return ids
+
+    def to_bytes(self, state):
+        return state.to_bytes(self.n_bytes, "little")
+
+    def from_bytes(self, b):
+        return int.from_bytes(b, "little")
+
+    def to_array(self, state):
+        packed = np.frombuffer(self.to_bytes(state), dtype=np.uint8)
+        return np.unpackbits(packed, count=self.n_facts, bitorder="little").astype(bool)
+
+    def from_array(self, array):
+        return self.from_bytes(np.packbits(array, bitorder="little").tobytes())
@@ -2,64 +2,222 @@ import gym
 import numpy as np
 from gridenvs.env import GridEnv
 from gridenvs.utils import Colors
+from pddl2gym.simulator import PDDLDomainSimulator
+from pddl2gym.utils import LRUCache
+from pddl2gym.profiling import Profiler, profile_env
 
 
-class PDDLEnv(gym.Env):  # TODO: use gym.GoalEnv?
+GoalEnv = getattr(gym, "GoalEnv", gym.Env)  # removed from gym in 0.26
+
+
+def compute_goal_rewards(achieved_goal, desired_goal):
+    # Batched goal test on packed fact bitmasks (uint8 arrays, see StateEncoder.to_bytes): 1 where all the facts of
+    # desired_goal are set in achieved_goal, 0 otherwise. Arrays of shape (..., n_bytes).
+    achieved_goal = np.asarray(achieved_goal, dtype=np.uint8)
+    desired_goal = np.asarray(desired_goal, dtype=np.uint8)
+    return np.all(achieved_goal & desired_goal == desired_goal, axis=-1).astype(np.float32)
+
+
+def encode_atoms(simulator, atoms):
+    # Packed fact bitmask of atoms over the grounded facts of the (current) problem of the simulator
+    encoder = simulator.get_encoder()
+    return np.frombuffer(encoder.to_bytes(encoder.encode(atoms)), dtype=np.uint8)
+
+
+def decode_atoms(simulator, packed):
+    encoder = simulator.get_encoder()
+    return encoder.decode(encoder.from_bytes(np.asarray(packed, dtype=np.uint8).tobytes()))
+
+
+class PDDLEnv(gym.Env):
     def __init__(self, simulator):
         self.simulator = simulator
+        self._goal = None  # goal of self.goal_count, recounted if the goal changed (see change_goal)
+        self.goal_count = 0
+
+    def _get_goal_count(self):
+        goal = self.simulator.get_goal()
+        if self._goal is not goal:
+            self._goal, self.goal_count = goal, self.simulator.get_goal_count(self.state)
+        return self.goal_count
 
     def step(self, action):
+        # The goal test only checks the goal facts among the effects of the operator (see update_goal_count)
+        goal_count = self.simulator.update_goal_count(self.state, action, self._get_goal_count())
         self.state = self.simulator.apply(self.state, action)
+        self.goal_count = goal_count
         atoms = self.simulator.get_atoms(self.state)
-        done = self.simulator.goal_reached(self.state)
+        done = goal_count == len(self._goal)
         reward = float(done)
         return atoms, reward, done, {}
 
     def reset(self):
         self.state = self.simulator.reset()
+        self._goal = None
         return self.simulator.get_atoms(self.state)
 
     def clone_state(self):
-        return self.state
+        # Compact snapshot of the state as bytes (see PDDLProblemSimulator.get_snapshot)
+        return self.simulator.get_snapshot(self.state)
+
+    def restore_state(self, snapshot):
+        self.state = self.simulator.restore_snapshot(snapshot)
+        self._goal = None
 
-    def restore_state(self, state):
-        self.state = state
+    def close(self):
+        if isinstance(self.simulator, PDDLDomainSimulator):
+            self.simulator.close()
+
+
+class PDDLGoalEnv(PDDLEnv, GoalEnv):
+    # PDDLEnv with the gym GoalEnv interface. Observations are dicts of packed fact bitmasks (see encode_atoms):
+    # "observation" and "achieved_goal" encode the state and "desired_goal" the goal, so that transitions can be
+    # relabeled with achieved goals and rewarded in batch with compute_reward. With a PDDLDomainSimulator, encodings
+    # are only comparable between problems with the same grounded facts (e.g. the same objects).
+    def __init__(self, simulator):
+        super(PDDLGoalEnv, self).__init__(simulator)
+        space = gym.spaces.Box(0, 255, shape=(simulator.get_encoder().n_bytes,), dtype=np.uint8)
+        self.observation_space = gym.spaces.Dict({"observation": space, "achieved_goal": space, "desired_goal": space})
+        self._desired_goal = (None, None)
+
+    def _get_obs(self):
+        achieved_goal = encode_atoms(self.simulator, self.simulator.get_atoms(self.state))
+        goal = self.simulator.get_goal()
+        if self._desired_goal[0] is not goal:  # encoded once per goal
+            self._desired_goal = (goal, encode_atoms(self.simulator, goal))
+        return {"observation": achieved_goal, "achieved_goal": achieved_goal, "desired_goal": self._desired_goal[1]}
+
+    def step(self, action):
+        self.state = self.simulator.apply(self.state, action)
+        obs = self._get_obs()
+        reward = float(self.compute_reward(obs["achieved_goal"], obs["desired_goal"], None))
+        done = reward > 0
+        return obs, reward, done, {"is_success": done}
+
+    def reset(self):
+        self.state = self.simulator.reset()
+        return self._get_obs()
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        # Batched: achieved_goal and desired_goal of shape (..., n_bytes)
+        return compute_goal_rewards(achieved_goal, desired_goal)
 
 
 class PDDLGridEnv(GridEnv):
-    def __init__(self, simulator, representation, **kwargs):
+    def __init__(self, simulator, representation, render_cache_size=0, **kwargs):
+        # Grid states, reduced actions and rendered frames are cached for the last render_cache_size states (0, the
+        # default, disables the caches). Cached frames are returned read-only, as they are shared.
         self.simulator = simulator
         self.representation = representation
+        self.gridstate_cache = LRUCache(render_cache_size)
+        self.action_cache = LRUCache(render_cache_size)
+        self.render_cache = LRUCache(render_cache_size)
+        self.max_moves = kwargs.get("max_moves")
+        self._moves = 0
         super(PDDLGridEnv, self).__init__(n_actions=representation.get_n_actions(self.simulator.problem),
                                           using_immutable_states=True,
                                           **kwargs)
 
+    def reset(self):
+        # GridEnv.reset sets up the initial state; the observation is rendered by get_observation, through the render
+        # cache
+        super(PDDLGridEnv, self).reset()
+        self._moves = 0
+        return self.get_observation()
+
+    def step(self, action):
+        # As GridEnv.step, with the observation rendered by get_observation, through the render cache
+        next_state, reward, done, info = self.get_next_state(self._state["state"], action)
+        self._state["state"] = next_state
+        self._moves += 1
+        if not done and self.max_moves is not None and self._moves >= self.max_moves:
+            done = True
+            info["TimeLimit.truncated"] = True
+        return self.get_observation(), reward, done, info
+
     def get_init_state(self):
         simulator_state = self.simulator.reset()
         atoms = self.simulator.get_atoms(simulator_state)
-        grid_state = self.representation.get_gridstate(self.simulator.problem, atoms)
+        structure = self.representation.get_structure(self.simulator.problem, atoms)
+        grid_state = self.representation.get_gridstate(self.simulator.problem, structure)
         self._goal_obs = self._get_goal_obs()
-        return {"simulator_state": simulator_state, "grid_state": grid_state}
+        return {"simulator_state": simulator_state,
+                "structure": structure,
+                "grid_state": grid_state,
+                "actions": self._get_reduced_actions(self.simulator, simulator_state, structure),
+                "goal": self.simulator.get_goal(),
+                "goal_count": self.simulator.get_goal_count(simulator_state)}
+
+    def _get_reduced_actions(self, simulator, simulator_state, structure):
+        # (reduced actions, action mask, operator ids) of a state, computed once per state and kept in the state dict
+        # and the action cache. The mask and operator ids are read-only, as they may be shared.
+        key = (simulator.problem, simulator_state)
+        entry = self.action_cache.get(key)
+        if entry is None:
+            actions = self.representation.get_reduced_actions(simulator.problem, structure)
+            operator_ids = np.array([-1 if a is None else simulator.get_operator_index(a) for a in actions],
+                                    dtype=np.int64)
+            mask = operator_ids >= 0
+            operator_ids.setflags(write=False)
+            mask.setflags(write=False)
+            entry = (actions, mask, operator_ids)
+            self.action_cache.put(key, entry)
+        return entry
+
+    @staticmethod
+    def _get_info(state, goal_count, goal):
+        # The info of a step: the fraction of goal facts satisfied, and the action mask and grounded operator ids
+        # (-1 for masked actions) of the reduced actions of the next state
+        _, mask, operator_ids = state["actions"]
+        return {"goal_fraction": PDDLGridEnv._goal_fraction(goal_count, goal),
+                "action_mask": mask,
+                "operator_ids": operator_ids}
+
+    def _get_goal_count(self, state):
+        # Number of goal facts satisfied in state, recomputed if the goal changed (see change_goal) since
+        if state["goal"] is not self.simulator.get_goal():
+            return self.simulator.get_goal_count(state["simulator_state"])
+        return state["goal_count"]
+
+    @staticmethod
+    def _goal_fraction(goal_count, goal):
+        return goal_count / len(goal) if goal else 1.0
 
     def get_next_state(self, state, action):
+        # See _get_info for the info dict. Masked reduced actions leave the state unchanged, with "invalid_action" set
+        # in the info.
         if np.issubdtype(type(action), np.integer):
-            atoms = self.simulator.get_atoms(state["simulator_state"])
-            actions = self.representation.get_reduced_actions(self.simulator.problem, atoms)
+            actions = state["actions"][0]
             assert action < len(actions), f"Action index {action} exceeds the number of actions ({len(actions)})"
             action = actions[action]
 
+        goal = self.simulator.get_goal()
+        goal_count = self._get_goal_count(state)
         if action is None:
-            return state, 0.0, False, {}
+            info = self._get_info(state, goal_count, goal)
+            info["invalid_action"] = True
+            return state, 0.0, False, info
 
         simulator_state = self.simulator.apply(state["simulator_state"], action)
         atoms = self.simulator.get_atoms(simulator_state)
-        grid_state = self.representation.get_gridstate(self.simulator.problem, atoms)
-        done = self.simulator.goal_reached(simulator_state)
+        structure = self.representation.update_structure(self.simulator.problem, state["structure"], atoms,
+                                                         self.simulator.get_operator(action))
+        key = (self.simulator.problem, simulator_state)
+        grid_state = self.gridstate_cache.get(key)
+        if grid_state is None:
+            grid_state = self.representation.get_gridstate(self.simulator.problem, structure)
+            self.gridstate_cache.put(key, grid_state)
+        goal_count = self.simulator.update_goal_count(state["simulator_state"], action, goal_count)
+        done = goal_count == len(goal)
         reward = float(done)
 
         next_state = {"simulator_state": simulator_state,
-                      "grid_state": grid_state}
-        return next_state, reward, done, {}
+                      "structure": structure,
+                      "grid_state": grid_state,
+                      "actions": self._get_reduced_actions(self.simulator, simulator_state, structure),
+                      "goal": goal,
+                      "goal_count": goal_count}
+        return next_state, reward, done, self._get_info(next_state, goal_count, goal)
 
     def get_gridstate(self, state):
         return state["grid_state"]
@@ -67,18 +225,106 @@ class PDDLGridEnv(GridEnv):
     def get_goal_obs(self):
         return self._goal_obs
 
-    def _get_goal_obs(self):
-        goal_atoms = self.simulator.get_goal()
-        complete_goal_atoms = self.representation.get_atoms_from_subset(self.simulator.problem, goal_atoms)
-        grid_objects = self.representation.get_gridstate(self.simulator.problem, complete_goal_atoms)
-        goal_obs = self.world.render(grid_objects, size=self.pixel_size)
+    def _get_goal_obs(self, goal_atoms=None):
+        if goal_atoms is None:
+            goal_atoms = self.simulator.get_goal()
+        # The goal frame only depends on the goal atoms and the objects, so it is shared by problems that only differ
+        # in their initial state (e.g. the ones of a PDDLDomainSimulator)
+        objects = tuple(sorted((o, t.name) for o, t in self.simulator.problem.objects.items()))
+        key = ("goal", objects, goal_atoms)
+        goal_obs = self.render_cache.get(key)
+        if goal_obs is None:
+            complete_goal_atoms = self.representation.get_atoms_from_subset(self.simulator.problem, goal_atoms)
+            grid_objects = self.representation.get_gridstate(self.simulator.problem, complete_goal_atoms)
+            goal_obs = self.render_gridstate(grid_objects, key)
         return goal_obs
 
+    def render_goals(self, goals):
+        # Goal observations of a batch of goals, given as packed fact bitmasks of shape (n, n_bytes) (e.g. achieved
+        # goals to relabel transitions with, see get_achieved_goal). Each distinct goal is completed and rendered
+        # once per call, and kept in the render cache if enabled, so relabeling mostly costs a gather.
+        goals = np.asarray(goals, dtype=np.uint8)
+        unique_goals, inverse = np.unique(goals, axis=0, return_inverse=True)
+        frames = np.stack([self._get_goal_obs(decode_atoms(self.simulator, g)) for g in unique_goals])
+        return frames[inverse.reshape(-1)]
+
+    def get_achieved_goal(self, state=None):
+        # Packed fact bitmask of the state, as the achieved goals of PDDLGoalEnv
+        if state is None:
+            state = self._state["state"]
+        return encode_atoms(self.simulator, self.simulator.get_atoms(state["simulator_state"]))
+
+    def get_desired_goal(self):
+        return encode_atoms(self.simulator, self.simulator.get_goal())
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        return compute_goal_rewards(achieved_goal, desired_goal)
+
+    def render_gridstate(self, grid_state, key=None):
+        # Renders a grid state with the gridenvs world. If a key is given, the frame is stored in the render cache (and
+        # made read-only, as it may be shared); callers look it up first.
+        obs = self.world.render(grid_state, size=self.pixel_size)
+        if key is not None and self.render_cache.capacity > 0:
+            obs.setflags(write=False)
+            self.render_cache.put(key, obs)
+        return obs
+
+    def get_observation(self, state=None):
+        if state is None:
+            state = self._state["state"]
+        key = (self.simulator.problem, state["simulator_state"])
+        obs = self.render_cache.get(key)
+        if obs is None:
+            obs = self.render_gridstate(state["grid_state"], key)
+        return obs
+
+    def get_tensor(self, state=None, out=None, one_hot=False):
+        # NumPy encoding of the state given by the representation (see PDDLRepresentation.get_tensor)
+        if state is None:
+            state = self._state["state"]
+        return self.representation.get_tensor(self.simulator.problem, state["structure"], out=out, one_hot=one_hot)
+
+    def get_cache_stats(self):
+        return {"gridstate": self.gridstate_cache.get_stats(),
+                "actions": self.action_cache.get_stats(),
+                "render": self.render_cache.get_stats()}
+
+    def enable_profiling(self, callback=None):
+        # Times the env, simulator, representation and renderer stages until disable_profiling() is called. Returns the
+        # Profiler, whose summary() gives the cumulative time and calls per stage (see pddl2gym.profiling).
+        self.disable_profiling()
+        self.profiler = Profiler(callback)
+        profile_env(self.profiler, self)
+        return self.profiler
+
+    def disable_profiling(self):
+        profiler = getattr(self, "profiler", None)
+        if profiler is not None:
+            profiler.unwrap()
+            self.profiler = None
+        return profiler
+
+    def close(self):
+        if isinstance(self.simulator, PDDLDomainSimulator):
+            self.simulator.close()  # stops prefetching
+        super(PDDLGridEnv, self).close()
+
     def get_indexed_actions(self, state=None):
         if state is None:
             state = self._state["state"]
-        atoms = self.simulator.get_atoms(state["simulator_state"])
-        return self.representation.get_reduced_actions(self.simulator.problem, atoms)
+        return state["actions"][0]
+
+    def get_action_mask(self, state=None):
+        # Boolean array of the reduced actions that are not None (applicable) in the state
+        if state is None:
+            state = self._state["state"]
+        return state["actions"][1]
+
+    def get_operator_ids(self, state=None):
+        # Grounded operator id of each reduced action (see PDDLProblemSimulator.get_operator_index), -1 if masked
+        if state is None:
+            state = self._state["state"]
+        return state["actions"][2]
 
     def get_applicable_actions(self, state=None):
         if state is None:
@@ -87,6 +333,122 @@ class PDDLGridEnv(GridEnv):
         return self.simulator.get_applicable_actions(self.simulator.problem, atoms)
 
 
+class PDDLBatchEnv:
+    # Steps n_envs copies of a PDDLGridEnv at once, taking an array of reduced action indices and returning stacked
+    # observations, rewards and dones. Each copy keeps its own problem simulator: with a PDDLDomainSimulator, a copy
+    # that finishes is reset to the next problem of the generator without invalidating the states of the others.
+    def __init__(self, simulator, representation, n_envs, max_moves=100, **kwargs):
+        self.simulator = simulator
+        self.representation = representation
+        self.n_envs = n_envs
+        self.max_moves = max_moves
+        self.env = PDDLGridEnv(simulator, representation, max_moves=max_moves, **kwargs)  # for rendering and its caches
+        self.n_actions = representation.get_n_actions(simulator.problem)
+        self.simulators = [None]*n_envs
+        self.states = [None]*n_envs
+        self.structures = [None]*n_envs
+        self.grid_states = [None]*n_envs  # built when rendering, reset to None when the state changes
+        # (reduced actions, action mask, operator ids), see PDDLGridEnv._get_reduced_actions
+        self.actions = [None]*n_envs
+        self.goal_counts = [0]*n_envs
+        self.moves = np.zeros(n_envs, dtype=np.int64)
+
+    def _reset_env(self, i):
+        state = self.simulator.reset()
+        if isinstance(self.simulator, PDDLDomainSimulator):
+            self.simulators[i] = self.simulator.problem_simulator
+            state = state[1]
+        else:
+            self.simulators[i] = self.simulator
+        self.states[i] = state
+        self.structures[i] = self.representation.get_structure(self.simulators[i].problem,
+                                                               self.simulators[i].get_atoms(state))
+        self.grid_states[i] = None
+        self.actions[i] = self.env._get_reduced_actions(self.simulators[i], state, self.structures[i])
+        self.goal_counts[i] = self.simulators[i].get_goal_count(state)
+        self.moves[i] = 0
+        return self._render(i)
+
+    def _render(self, i):
+        key = (self.simulators[i].problem, self.states[i])
+        obs = self.env.render_cache.get(key)
+        if obs is None:
+            if self.grid_states[i] is None:
+                self.grid_states[i] = self.representation.get_gridstate(self.simulators[i].problem, self.structures[i])
+            obs = self.env.render_gridstate(self.grid_states[i], key)
+        return obs
+
+    def reset(self):
+        return np.stack([self._reset_env(i) for i in range(self.n_envs)])
+
+    def get_tensors(self, out=None, one_hot=False):
+        # Representation tensors of all copies (see PDDLRepresentation.get_tensor), written in place into out if given.
+        # With a PDDLDomainSimulator, all problems need to have the same tensor shape (e.g. a fixed number of blocks).
+        if out is None:
+            shape = self.representation.get_tensor_shape(self.simulators[0].problem, one_hot)
+            out = np.zeros((self.n_envs,) + shape, dtype=np.uint8)
+        for i in range(self.n_envs):
+            self.representation.get_tensor(self.simulators[i].problem, self.structures[i], out=out[i], one_hot=one_hot)
+        return out
+
+    def get_action_masks(self, out=None):
+        # (n_envs, n_actions) boolean array of the applicable reduced actions of the current states of all copies
+        if out is None:
+            out = np.zeros((self.n_envs, self.n_actions), dtype=bool)
+        for i in range(self.n_envs):
+            out[i] = self.actions[i][1]
+        return out
+
+    def get_operator_ids(self, out=None):
+        # (n_envs, n_actions) grounded operator ids of the reduced actions of all copies, -1 if masked
+        if out is None:
+            out = np.zeros((self.n_envs, self.n_actions), dtype=np.int64)
+        for i in range(self.n_envs):
+            out[i] = self.actions[i][2]
+        return out
+
+    def step(self, actions):
+        assert len(actions) == self.n_envs
+        observations = []
+        rewards = np.zeros(self.n_envs, dtype=np.float32)
+        dones = np.zeros(self.n_envs, dtype=bool)
+        infos = [{} for _ in range(self.n_envs)]
+        for i, action in enumerate(actions):
+            simulator = self.simulators[i]
+            reduced_actions = self.actions[i][0]
+            assert action < len(reduced_actions), f"Action index {action} exceeds the number of actions ({len(reduced_actions)})"
+            if reduced_actions[action] is None:
+                infos[i]["invalid_action"] = True
+            else:
+                self.goal_counts[i] = simulator.update_goal_count(self.states[i], reduced_actions[action],
+                                                                  self.goal_counts[i])
+                self.states[i] = simulator.apply(self.states[i], reduced_actions[action])
+                self.structures[i] = self.representation.update_structure(simulator.problem, self.structures[i],
+                                                                          simulator.get_atoms(self.states[i]),
+                                                                          simulator.get_operator(reduced_actions[action]))
+                self.grid_states[i] = None
+                self.actions[i] = self.env._get_reduced_actions(simulator, self.states[i], self.structures[i])
+                dones[i] = self.goal_counts[i] == len(simulator.get_goal())
+                rewards[i] = float(dones[i])
+            infos[i]["goal_fraction"] = PDDLGridEnv._goal_fraction(self.goal_counts[i], simulator.get_goal())
+            self.moves[i] += 1
+
+            obs = self._render(i)
+            if not dones[i] and self.moves[i] >= self.max_moves:
+                dones[i] = True
+                infos[i]["TimeLimit.truncated"] = True
+            if dones[i]:
+                infos[i]["terminal_observation"] = obs
+                obs = self._reset_env(i)
+            infos[i]["action_mask"] = self.actions[i][1]  # of the returned observation (after a reset if done)
+            infos[i]["operator_ids"] = self.actions[i][2]
+            observations.append(obs)
+        return np.stack(observations), rewards, dones, infos
+
+    def close(self):
+        self.env.close()  # the env shares the simulator
+
+
 class PDDLRepresentation:
     def __init__(self):
         self.colors = [Colors.hex_to_rgb(c) for c in Colors.distinguishable_hex]
@@ -94,6 +456,16 @@ class PDDLRepresentation:
     def get_n_actions(self, problem):
         raise NotImplementedError()
 
+    def get_structure(self, problem, atoms):
+        # Structured view of a state, passed instead of the atoms to get_reduced_actions and get_gridstate by the
+        # environments. By default, the atoms themselves.
+        return atoms
+
+    def update_structure(self, problem, structure, atoms, operator):
+        # Structure of the successor state (atoms) reached by applying the grounded operator. Representations can
+        # override this to update the structure from the operator effects instead of recomputing it.
+        return self.get_structure(problem, atoms)
+
     def get_reduced_actions(self, problem, atoms):
         raise NotImplementedError()
 
@@ -103,6 +475,13 @@ class PDDLRepresentation:
     def get_atoms_from_subset(self, problem, atoms):
         raise NotImplementedError()
 
+    def get_tensor_shape(self, problem, one_hot=False):
+        raise NotImplementedError()
+
+    def get_tensor(self, problem, atoms, out=None, one_hot=False):
+        # Compact NumPy encoding of a state (atoms or structure), written into out if given
+        raise NotImplementedError()
+
 
 if __name__ == "__main__":
     import os
@@ -0,0 +1,153 @@
+from pyperplan.grounding import _get_partial_state
+from pddl2gym.utils import to_tuple, LRUCache
+import numpy as np
+
+
+class GenericRepresentation:
+    # Domain-agnostic NumPy encoding of states, derived from the predicates of the domain and the objects of each
+    # problem, with the same tensor interface as PDDLRepresentation (get_tensor_shape, get_tensor). A state is a flat
+    # uint8 vector [nullary (P0) | unary (P1 x N) | binary (P2 x N x N)], where Pk are the predicates of arity k
+    # (sorted by name) and N the objects of the problem (sorted by name), or max_objects if given (padding, so that
+    # problems with different numbers of objects have the same shape). Predicates of higher arity are not encoded.
+    # Every grounded fact of a problem is mapped once to its position in the vector (see _get_layout), so encoding a
+    # state is a single scatter. Static facts (removed from the states by the grounding) are always set.
+    # Problems need to be grounded by a simulator first (see problem.atom_table), and states are atoms or int bitmasks
+    # of a simulator with compact_states (fact ids follow the order of problem.atom_table, as in StateEncoder).
+    def __init__(self, domain, max_objects=None, cache_size=64):
+        predicates = sorted(domain.predicates.values(), key=lambda p: p.name)
+        self.predicates = {arity: [p.name for p in predicates if len(p.signature) == arity] for arity in (0, 1, 2)}
+        self.predicate_ids = {name: i for names in self.predicates.values() for i, name in enumerate(names)}
+        self.types = sorted(domain.types)
+        self.type_ids = {t: i for i, t in enumerate(self.types)}
+        self.max_objects = max_objects
+        self._layouts = LRUCache(cache_size)  # (problem, n_objects) -> layout
+
+    def get_n_objects(self, problem, max_objects=None):
+        n = len(problem.objects)
+        max_objects = self.max_objects if max_objects is None else max_objects
+        if max_objects is None:
+            return n
+        assert n <= max_objects, f"Problem has {n} objects, more than max_objects={max_objects}"
+        return max_objects
+
+    def get_shapes(self, n_objects):
+        n0, n1, n2 = (len(self.predicates[arity]) for arity in (0, 1, 2))
+        return {"nullary": (n0,), "unary": (n1, n_objects), "binary": (n2, n_objects, n_objects)}
+
+    def _get_layout(self, problem, n_objects):
+        key = (problem, n_objects)
+        layout = self._layouts.get(key)
+        if layout is not None:
+            return layout
+        if not hasattr(problem, "atom_table"):
+            raise Exception("Problem has not been grounded by a simulator (problem.atom_table is missing)")
+        shapes = self.get_shapes(n_objects)
+        offsets = np.cumsum([0] + [np.prod(shapes[k], dtype=np.int64) for k in ("nullary", "unary", "binary")])
+        object_ids = {o: i for i, o in enumerate(sorted(problem.objects))}
+
+        def get_position(name, params):
+            arity = len(params)
+            if arity > 2 or name not in self.predicate_ids:
+                return -1
+            i = self.predicate_ids[name]
+            if arity == 0:
+                return offsets[0] + i
+            if arity == 1:
+                return offsets[1] + i * n_objects + object_ids[params[0]]
+            return offsets[2] + (i * n_objects + object_ids[params[0]]) * n_objects + object_ids[params[1]]
+
+        parsed = problem.atom_table.parsed
+        positions = np.array([get_position(*p) for p in parsed.values()], dtype=np.int64)
+        static = np.zeros(offsets[-1], dtype=np.uint8)
+        # Initial facts that are not grounded facts, in the same string format (e.g. "(handempty)")
+        for atom in _get_partial_state(problem.initial_state) - parsed.keys():
+            position = get_position(*to_tuple(atom))
+            if position >= 0:
+                static[position] = 1
+        # Grounded facts can change, so they must not be set permanently (e.g. (handempty) after a pick-up)
+        assert not static[positions[positions >= 0]].any(), "A grounded fact was taken as static"
+
+        # Node features of the object graph: one-hot type of each object, including its supertypes
+        types = np.zeros((n_objects, len(self.types)), dtype=np.uint8)
+        for o, i in object_ids.items():
+            t = problem.objects[o]
+            while t is not None:
+                types[i, self.type_ids[t.name]] = 1
+                t = t.parent
+        object_mask = np.zeros(n_objects, dtype=bool)
+        object_mask[:len(object_ids)] = True
+
+        layout = {"positions": positions,
+                  "fact_positions": dict(zip(parsed, positions.tolist())),
+                  "static": static,
+                  "offsets": offsets,
+                  "types": types,
+                  "object_mask": object_mask}
+        self._layouts.put(key, layout)
+        return layout
+
+    def get_tensor_shape(self, problem, one_hot=False):
+        # one_hot is accepted for compatibility with PDDLRepresentation: the encoding is always binary
+        return (int(self._get_layout(problem, self.get_n_objects(problem))["offsets"][-1]),)
+
+    def get_tensor(self, problem, atoms, out=None, one_hot=False, max_objects=None):
+        layout = self._get_layout(problem, self.get_n_objects(problem, max_objects))
+        if isinstance(atoms, int):
+            n_facts = len(layout["positions"])
+            packed = np.frombuffer(atoms.to_bytes((n_facts + 7) // 8, "little"), dtype=np.uint8)
+            positions = layout["positions"][np.unpackbits(packed, count=n_facts, bitorder="little").astype(bool)]
+        else:
+            fact_positions = layout["fact_positions"]
+            positions = np.fromiter((fact_positions.get(a, -1) for a in atoms), dtype=np.int64, count=len(atoms))
+        if out is None:
+            out = layout["static"].copy()
+        else:
+            out[:] = layout["static"]
+        out[positions[positions >= 0]] = 1
+        return out
+
+    def split(self, tensor, n_objects):
+        # Views of a flat tensor (or a batch of them, along the first axes) as nullary, unary and binary arrays
+        shapes = self.get_shapes(n_objects)
+        batch_shape = tensor.shape[:-1]
+        sizes = np.cumsum([np.prod(shapes[k], dtype=np.int64) for k in ("nullary", "unary")])
+        return {k: part.reshape(batch_shape + shapes[k])
+                for k, part in zip(("nullary", "unary", "binary"), np.split(tensor, sizes, axis=-1))}
+
+    def get_tensors(self, problem, atoms, max_objects=None):
+        n_objects = self.get_n_objects(problem, max_objects)
+        return self.split(self.get_tensor(problem, atoms, max_objects=max_objects), n_objects)
+
+    def get_graph(self, problem, atoms, max_objects=None):
+        # Padded object graph: global features (nullary predicates), node features (unary predicates and object types),
+        # adjacency matrices (one per binary predicate), edge list (predicate, source, target) and mask of real objects
+        n_objects = self.get_n_objects(problem, max_objects)
+        layout = self._get_layout(problem, n_objects)
+        tensors = self.get_tensors(problem, atoms, max_objects=max_objects)
+        return {"globals": tensors["nullary"],
+                "nodes": np.concatenate([tensors["unary"].T, layout["types"]], axis=1),
+                "adjacency": tensors["binary"],
+                "edges": np.argwhere(tensors["binary"]),
+                "object_mask": layout["object_mask"]}
+
+    def get_batch(self, problems, states, graph=False, max_objects=None):
+        # Stacked tensors (or graphs, without edge lists) of states of possibly different problems, padded to the
+        # largest number of objects in the batch unless max_objects is given
+        if max_objects is None:
+            max_objects = self.max_objects
+        if max_objects is None:
+            max_objects = max(len(p.objects) for p in problems)
+        size = int(self._get_layout(problems[0], self.get_n_objects(problems[0], max_objects))["offsets"][-1])
+        out = np.zeros((len(problems), size), dtype=np.uint8)
+        for i, (problem, atoms) in enumerate(zip(problems, states)):
+            self.get_tensor(problem, atoms, out=out[i], max_objects=max_objects)
+        tensors = self.split(out, max_objects)
+        layouts = [self._get_layout(p, max_objects) for p in problems]
+        object_mask = np.stack([layout["object_mask"] for layout in layouts])
+        if not graph:
+            return dict(tensors, object_mask=object_mask)
+        types = np.stack([layout["types"] for layout in layouts])
+        return {"globals": tensors["nullary"],
+                "nodes": np.concatenate([tensors["unary"].transpose(0, 2, 1), types], axis=2),
+                "adjacency": tensors["binary"],
+                "object_mask": object_mask}
@@ -0,0 +1,21 @@
+# Generates envs.json, the index of the gym environments registered by pddl2gym.blocks and pddl2gym.blocks_columns.
+# Run `python -m pddl2gym.manifest` after adding or renaming problem files.
+from pddl2gym.utils import MANIFEST_PATH
+import json
+
+
+def build_manifest():
+    from pddl2gym import blocks, blocks_columns
+    return {module.__name__: module.get_env_specs() for module in (blocks, blocks_columns)}
+
+
+def write_manifest(path=MANIFEST_PATH):
+    manifest = build_manifest()
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    write_manifest()
+    print(f"Manifest written to {MANIFEST_PATH}")
@@ -0,0 +1,52 @@
+class NoveltyTable:
+    # Novelty tables of width-based search (IW(1), IW(2)) over the grounded fact ids of a simulator (see
+    # get_encoder). Width 1 is a bit array (a Python int, like compact states) of the facts seen so far; width 2 adds,
+    # for each fact i, a bit array pairs[i] of the facts seen together with i, so a state has a new pair if its mask
+    # is not included in pairs[i] for one of its facts i. States can be frozensets or int bitmasks, or (problem id,
+    # state) tuples for a PDDLDomainSimulator (tables are then over the facts of the current problem; call reset() for
+    # a new problem).
+    def __init__(self, simulator, width=2):
+        assert width in (1, 2)
+        self.simulator = simulator
+        self.width = width
+        self.reset()
+
+    def reset(self):
+        self.encoder = self.simulator.get_encoder()
+        self.facts = 0
+        if self.width == 2:
+            self.pairs = [0] * self.encoder.n_facts
+
+    def _get_mask(self, state):
+        if isinstance(state, tuple):  # PDDLDomainSimulator
+            state = state[1]
+        return state if isinstance(state, int) else self.encoder.encode(state)
+
+    def novelty(self, state, update=True):
+        # Size of the smallest tuple of facts of state that was not seen before (1 or 2), or width + 1 if all tuples
+        # up to the width were seen. With update, the tuples of the state are marked as seen.
+        mask = self._get_mask(state)
+        novelty = self.width + 1
+        if mask & ~self.facts:
+            novelty = 1
+        if update:
+            self.facts |= mask
+        if self.width == 2 and (novelty > 1 or update):
+            pairs = self.pairs
+            facts = mask
+            while facts:  # fact ids of the state, lowest first
+                low = facts & -facts
+                facts ^= low
+                i = low.bit_length() - 1
+                if novelty > 1 and mask & ~pairs[i]:
+                    novelty = 2
+                    if not update:
+                        break
+                if update:
+                    pairs[i] |= mask
+        return novelty
+
+    def apply(self, state, action):
+        # Applies action with the simulator and updates the tables with the successor. Returns (next_state, novelty).
+        next_state = self.simulator.apply(state, action)
+        return next_state, self.novelty(next_state)
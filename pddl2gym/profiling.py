@@ -0,0 +1,89 @@
+from collections import defaultdict
+import time
+
+
+SIMULATOR_STAGES = ("reset", "apply", "get_atoms", "goal_reached", "get_applicable_actions", "get_operator")
+REPRESENTATION_STAGES = ("get_structure", "update_structure", "get_reduced_actions", "get_gridstate",
+                         "get_atoms_from_subset", "get_tensor")
+ENV_STAGES = {"get_init_state": "env.reset",
+              "get_next_state": "env.step",
+              "get_observation": "env.get_observation"}
+
+
+class Profiler:
+    # Cumulative wall time and number of calls per stage, collected by wrapping methods of given objects (see wrap).
+    # Nothing is instrumented until then, so there is no overhead when profiling is not used. Stage times are
+    # inclusive: e.g. "env.step" includes the simulator and representation stages it calls. If callback is given, it
+    # is called with (stage, seconds) after every timed call.
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._wrapped = []
+
+    def wrap(self, obj, method, stage):
+        # Replaces obj.method by a timed version, as an instance attribute (the class is not modified)
+        fn = getattr(obj, method)
+        times, calls, callback = self.times, self.calls, self.callback
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                times[stage] += elapsed
+                calls[stage] += 1
+                if callback is not None:
+                    callback(stage, elapsed)
+
+        self._wrapped.append((obj, method, obj.__dict__.get(method)))
+        setattr(obj, method, timed)
+
+    def unwrap(self):
+        # Restores all wrapped methods, in reverse order in case a method was wrapped twice
+        for obj, method, original in reversed(self._wrapped):
+            if original is None:
+                delattr(obj, method)
+            else:
+                setattr(obj, method, original)
+        self._wrapped = []
+
+    def reset(self):
+        self.times.clear()
+        self.calls.clear()
+
+    def summary(self):
+        return {stage: {"calls": self.calls[stage],
+                        "total_s": self.times[stage],
+                        "mean_us": self.times[stage] / self.calls[stage] * 1e6}
+                for stage in sorted(self.times, key=self.times.get, reverse=True)}
+
+
+def profile_simulator(profiler, simulator):
+    # Atom parsing (AtomTable.parse) is only timed for PDDLProblemSimulators: the atom table of a PDDLDomainSimulator
+    # changes with every problem. The successor generator and atom table may be shared with other simulators of the
+    # same grounding (see simulator.get_problem_simulator), whose calls are then timed too.
+    for method in SIMULATOR_STAGES:
+        profiler.wrap(simulator, method, f"simulator.{method}")
+    if hasattr(simulator, "successor_generator"):
+        profiler.wrap(simulator.successor_generator, "get_applicable", "simulator.successor_generator")
+    if hasattr(simulator, "atom_table"):
+        profiler.wrap(simulator.atom_table, "parse", "atoms.parse")
+
+
+def profile_representation(profiler, representation):
+    for method in REPRESENTATION_STAGES:
+        profiler.wrap(representation, method, f"representation.{method}")
+
+
+def profile_env(profiler, env):
+    # Times the stages of a PDDLGridEnv: env.*, simulator.*, representation.* and renderer.render. The latter wraps
+    # the render method of the gridenvs world, so it counts every frame rendered, whatever the path
+    profile_simulator(profiler, env.simulator)
+    profile_representation(profiler, env.representation)
+    for method, stage in ENV_STAGES.items():
+        profiler.wrap(env, method, stage)
+    if getattr(env, "world", None) is None:
+        raise Exception("The env has no gridenvs world to profile yet")
+    profiler.wrap(env.world, "render", "renderer.render")
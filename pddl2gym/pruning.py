@@ -0,0 +1,98 @@
+from pyperplan.task import Task
+from collections import defaultdict
+
+
+def reachable(operators, initial_state):
+    # Relaxed (delete-free) reachability from the initial state. Returns the reachable facts and operators, the latter
+    # in their original order. Each operator counts its unreached preconditions, and is enabled when it gets to 0.
+    waiting = defaultdict(list)
+    missing = []
+    queue = list(initial_state)
+    for i, op in enumerate(operators):
+        missing.append(len(op.preconditions))
+        for fact in op.preconditions:
+            waiting[fact].append(i)
+
+    reached_facts = set(initial_state)
+    enabled = [i for i, n in enumerate(missing) if n == 0]
+    while queue or enabled:
+        while enabled:
+            for fact in operators[enabled.pop()].add_effects:
+                if fact not in reached_facts:
+                    reached_facts.add(fact)
+                    queue.append(fact)
+        if queue:
+            for i in waiting[queue.pop()]:
+                missing[i] -= 1
+                if missing[i] == 0:
+                    enabled.append(i)
+    return reached_facts, [op for i, op in enumerate(operators) if missing[i] == 0]
+
+
+def mutexes(task):
+    # Pairs of facts that are never true together in a reachable state, as a dict fact -> set of mutex facts. Greatest
+    # fixpoint: starting from all pairs not both in the initial state, (p, q) is discarded unless every operator that
+    # adds p also deletes q, or does not add q and has a precondition mutex with q. The candidate set of p is refined
+    # with one set intersection per operator adding p.
+    adders = defaultdict(list)
+    for op in task.operators:
+        for fact in op.add_effects:
+            adders[fact].append(op)
+    mutex = {p: task.facts - (task.initial_state if p in task.initial_state else set()) - {p} for p in task.facts}
+    changed = True
+    while changed:
+        changed = False
+        for p in task.facts:
+            m = mutex[p]
+            for op in adders[p]:
+                if not m:
+                    break
+                kept = set().union(*(mutex[r] for r in op.preconditions))
+                kept |= op.del_effects
+                kept -= op.add_effects
+                refined = m & kept
+                if len(refined) < len(m):
+                    for q in m - refined:
+                        mutex[q].discard(p)
+                    m = mutex[p] = refined
+                    changed = True
+    return mutex
+
+
+def relevant(operators, goals):
+    # Backwards relevance from the goal: a fact is relevant if it is a goal or a precondition of a relevant operator,
+    # and an operator is relevant if it adds or deletes a relevant fact. Unlike pyperplan's relevance analysis,
+    # effects of the remaining operators are kept, so that states stay complete.
+    relevant_facts = set(goals)
+    relevant_ops = set()
+    changed = True
+    while changed:
+        changed = False
+        for i, op in enumerate(operators):
+            if i not in relevant_ops and (op.add_effects & relevant_facts or op.del_effects & relevant_facts):
+                relevant_ops.add(i)
+                relevant_facts |= op.preconditions
+                changed = True
+    return [op for i, op in enumerate(operators) if i in relevant_ops]
+
+
+def prune_task(task, relevance=False):
+    # Removes the operators with mutex preconditions (e.g. (stack a a), which needs (holding a) and (clear a)) and the
+    # ones that are not reachable from the initial state (relaxed reachability), and with relevance the ones that
+    # cannot contribute to the goal, until a fixpoint. Facts are reduced to the reachable ones plus the goals.
+    # Returns the pruned task and a dict of operator/fact counts before and after pruning.
+    mutex = mutexes(task)
+    operators = [op for op in task.operators if not any(mutex[p] & op.preconditions for p in op.preconditions)]
+    while True:
+        facts, reached_operators = reachable(operators, task.initial_state)
+        if relevance:
+            reached_operators = relevant(reached_operators, task.goals)
+        if len(reached_operators) == len(operators):
+            break
+        operators = reached_operators
+    facts = (facts & task.facts) | task.goals
+    pruned_task = Task(task.name, facts, task.initial_state & facts, task.goals, operators)
+    return pruned_task, {"operators_before": len(task.operators),
+                         "operators_after": len(operators),
+                         "facts_before": len(task.facts),
+                         "facts_after": len(facts)}
@@ -0,0 +1,104 @@
+from pyperplan.pddl.pddl import Problem, Predicate
+from pddl2gym.simulator import get_problem_simulator
+from pddl2gym.utils import to_string, get_objects_by_type
+from math import comb, factorial
+import numpy as np
+
+
+def get_n_towers_distribution(n_blocks):
+    # Probability of k = 1..n towers in a uniformly random Blocks state (with empty hand) of n blocks: the number of
+    # states with k towers is the Lah number L(n, k) = C(n-1, k-1) n! / k!, out of sum_k L(n, k)
+    lah = [comb(n_blocks - 1, k - 1) * factorial(n_blocks) // factorial(k) for k in range(1, n_blocks + 1)]
+    total = sum(lah)
+    return np.array([n / total for n in lah])
+
+
+def get_blocks_template_problem(domain, n_blocks):
+    # Problem with all blocks on the table and no goal, only used to ground the operators over blocks a, b, c...
+    assert list(domain.types.keys()) == ['object']
+    assert n_blocks <= 26
+    block_type = domain.types['object']
+    blocks = [chr(97+i) for i in range(n_blocks)]
+    init = [Predicate('handempty', [])]
+    for b in blocks:
+        init.append(Predicate('ontable', [(b, block_type)]))
+        init.append(Predicate('clear', [(b, block_type)]))
+    problem = Problem(name=f"random-{n_blocks}",
+                      domain=domain,
+                      objects={b: block_type for b in blocks},
+                      init=init,
+                      goal=[])
+    problem.objects_by_type = get_objects_by_type(problem)
+    return problem
+
+
+class RandomBlocksSampler:
+    # Uniformly random Blocks states (towers on the table, empty hand) over the blocks of a grounded simulator, sampled
+    # in NumPy batches and encoded directly as fact bitmasks of its StateEncoder, without building PDDL problems.
+    # A state with k towers is a random permutation of the blocks cut at k-1 random positions, with k sampled with
+    # probability L(n, k) / sum L(n, k) (see get_n_towers_distribution): each state is produced by exactly k!
+    # (permutation, cuts) pairs, one per ordering of its towers, so all states are equally likely.
+    def __init__(self, simulator, seed=None):
+        self.simulator = simulator
+        self.rng = np.random.default_rng(seed)
+        self.blocks = sorted(simulator.problem.objects)
+        self.n_blocks = n = len(self.blocks)
+        self.p_towers = get_n_towers_distribution(n)
+        self.encoder = encoder = simulator.get_encoder()
+        fact_ids = encoder.fact_ids
+        self.on_ids = np.array([[fact_ids.get(to_string('on', [x, y]), -1) for y in self.blocks] for x in self.blocks])
+        self.ontable_ids = np.array([fact_ids[to_string('ontable', [b])] for b in self.blocks])
+        self.clear_ids = np.array([fact_ids[to_string('clear', [b])] for b in self.blocks])
+        self.handempty_id = fact_ids['(handempty)']
+
+    def sample_below(self, size):
+        # (size, n_blocks) array with the index of the block under each block, or -1 if it is on the table
+        n = self.n_blocks
+        rows = np.arange(size)[:, None]
+        n_towers = self.rng.choice(n, size=size, p=self.p_towers) + 1
+        order = np.argsort(self.rng.random((size, n)), axis=1)  # blocks of the towers, bottom to top
+        # Gap j (between order[j] and order[j+1]) is cut if it is among the n_towers-1 first in a random order
+        gap_ranks = np.argsort(np.argsort(self.rng.random((size, n - 1)), axis=1), axis=1)
+        stacked = gap_ranks >= n_towers[:, None] - 1
+        below = np.full((size, n), -1)
+        below[rows, order[:, 1:]] = np.where(stacked, order[:, :-1], -1)
+        return below
+
+    def encode(self, below, goal=False):
+        # Fact bitmasks (Python ints) of the states given by sample_below. Goals only have the on and ontable facts.
+        size, n = below.shape
+        rows = np.broadcast_to(np.arange(size)[:, None], below.shape)
+        blocks = np.broadcast_to(np.arange(n), below.shape)
+        on_table = below < 0
+        facts = np.zeros((size, self.encoder.n_facts), dtype=bool)
+        facts[rows[~on_table], self.on_ids[blocks[~on_table], below[~on_table]]] = True
+        facts[rows[on_table], self.ontable_ids[blocks[on_table]]] = True
+        if not goal:
+            clear = np.ones((size, n), dtype=bool)
+            clear[rows[~on_table], below[~on_table]] = False
+            facts[rows[clear], self.clear_ids[blocks[clear]]] = True
+            facts[:, self.handempty_id] = True
+        packed = np.packbits(facts, axis=1, bitorder="little")
+        return [self.encoder.from_bytes(row.tobytes()) for row in packed]
+
+    def sample(self, size):
+        # Lists of size encoded initial states and goals
+        return self.encode(self.sample_below(size)), self.encode(self.sample_below(size), goal=True)
+
+    def sample_simulators(self, batch_size=1024):
+        # Endless generator of simulators of random problems (see PDDLProblemSimulator.with_states), e.g. for the
+        # problem_generator of a PDDLDomainSimulator. States are sampled batch_size at a time.
+        while True:
+            inits, goals = self.sample(batch_size)
+            if not self.simulator.compact_states:
+                inits = [self.encoder.decode(s) for s in inits]
+                goals = [self.encoder.decode(g) for g in goals]
+            for init, goal in zip(inits, goals):
+                yield self.simulator.with_states(init, goal)
+
+
+def get_random_blocks_generator(domain, n_blocks, compact_states=False, seed=None, batch_size=1024):
+    # Problem generator of uniformly random initial states and goals of n_blocks blocks for a PDDLDomainSimulator
+    # (with the same compact_states), all sharing a single grounding
+    simulator = get_problem_simulator(get_blocks_template_problem(domain, n_blocks), compact_states=compact_states)
+    return RandomBlocksSampler(simulator, seed=seed).sample_simulators(batch_size)
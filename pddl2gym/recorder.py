@@ -0,0 +1,206 @@
+from pyperplan.grounding import _get_partial_state
+from pyperplan.pddl.pddl import Problem, Predicate
+from pddl2gym.simulator import PDDLProblemSimulator, get_problem_simulator
+from pddl2gym.utils import parse_problem, parse_domain, to_tuple, to_string, get_objects_by_type, LRUCache
+import numpy as np
+import json
+import os
+
+
+# Files of a trajectory dataset directory. All of them are append-only.
+EPISODES_FILE = "episodes.bin"  # one EPISODE_DTYPE record per episode
+OPERATORS_FILE = "operators.bin"  # int32 operator ids of all episodes, concatenated (-1 for no-op actions)
+OPERATOR_NAMES_FILE = "operators.jsonl"  # operator id -> operator name, e.g. "(stack a b)"
+PROBLEMS_FILE = "problems.jsonl"  # problem id -> problem identity (see get_problem_identity)
+
+EPISODE_DTYPE = np.dtype([("problem", np.int32), ("start", np.int64), ("length", np.int32)])
+
+
+def get_problem_identity(problem):
+    # JSON-serializable identity of a problem: its PDDL files if it was parsed from files (see utils.parse_problem),
+    # or its domain file, objects, initial state and goal if it was generated (e.g. random column problems).
+    # problem can also be a PDDLProblemSimulator. Simulators built with with_states (e.g. random_blocks) share the
+    # problem of their template, so their initial state and goal are taken from their task, and their shared problem
+    # cannot be recorded on its own.
+    simulator = None
+    if isinstance(problem, PDDLProblemSimulator):
+        simulator, problem = problem, problem.problem
+    if simulator is not None and simulator.states_changed:
+        init = _get_partial_state(problem.initial_state) - simulator.task.facts  # static facts, not in the task
+        init |= simulator.task.initial_state
+        goal = simulator.task.goals
+    elif getattr(problem, "has_state_variants", False):
+        raise Exception("The problem is shared by simulators with other initial states and goals "
+                        "(see PDDLProblemSimulator.with_states): record the simulator instead")
+    else:
+        files = getattr(problem, "pddl_files", None)
+        if files is not None:
+            return {"pddl_files": [os.path.abspath(f) for f in files]}
+        init = _get_partial_state(problem.initial_state)
+        goal = _get_partial_state(problem.goal)
+    domain_file = getattr(problem.domain, "pddl_file", None)
+    if domain_file is None:
+        raise Exception("Cannot record a problem whose domain was not parsed with utils.parse_domain")
+    return {"domain_file": os.path.abspath(domain_file),
+            "name": problem.name,
+            "objects": {o: t.name for o, t in sorted(problem.objects.items())},
+            "init": sorted(init),
+            "goal": sorted(goal)}
+
+
+def _read_jsonl(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TrajectoryRecorder:
+    # Appends episodes to a dataset directory, as the identity of their problem plus the sequence of operators
+    # applied. Operator ids index a vocabulary of operator names shared by all the episodes of the dataset, so they do
+    # not depend on the grounding of each problem. Usage:
+    #   recorder.start_episode(simulator); recorder.record(action); ...; recorder.end_episode()
+    # where simulator is a PDDLProblemSimulator (e.g. the problem_simulator of a PDDLDomainSimulator) or a problem
+    # (see get_problem_identity).
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.operator_names = _read_jsonl(os.path.join(path, OPERATOR_NAMES_FILE))
+        self.operator_ids = {name: i for i, name in enumerate(self.operator_names)}
+        self.problems = {json.dumps(p, sort_keys=True): i
+                         for i, p in enumerate(_read_jsonl(os.path.join(path, PROBLEMS_FILE)))}
+        operators_path = os.path.join(path, OPERATORS_FILE)
+        self.n_transitions = os.path.getsize(operators_path) // 4 if os.path.exists(operators_path) else 0
+        self._problem = None
+        self._operators = None
+
+    def _append_line(self, file, obj):
+        with open(os.path.join(self.path, file), "a") as f:
+            f.write(json.dumps(obj, sort_keys=True) + "\n")
+
+    def start_episode(self, problem):
+        identity = get_problem_identity(problem)
+        key = json.dumps(identity, sort_keys=True)
+        if key not in self.problems:
+            self.problems[key] = len(self.problems)
+            self._append_line(PROBLEMS_FILE, identity)
+        self._problem = self.problems[key]
+        self._operators = []
+
+    def record(self, action):
+        # action: operator name or key (see PDDLProblemSimulator.operators), or None for a no-op
+        if action is None:
+            self._operators.append(-1)
+            return
+        name = action if isinstance(action, str) else to_string(action)
+        operator_id = self.operator_ids.get(name)
+        if operator_id is None:
+            operator_id = self.operator_ids[name] = len(self.operator_names)
+            self.operator_names.append(name)
+            self._append_line(OPERATOR_NAMES_FILE, name)
+        self._operators.append(operator_id)
+
+    def end_episode(self):
+        # Operators are written before the episode record, so that readers never see an incomplete episode
+        assert self._operators is not None, "start_episode() was not called"
+        with open(os.path.join(self.path, OPERATORS_FILE), "ab") as f:
+            f.write(np.asarray(self._operators, dtype=np.int32).tobytes())
+        episode = np.array([(self._problem, self.n_transitions, len(self._operators))], dtype=EPISODE_DTYPE)
+        with open(os.path.join(self.path, EPISODES_FILE), "ab") as f:
+            f.write(episode.tobytes())
+        self.n_transitions += len(self._operators)
+        self._problem = self._operators = None
+
+
+class TrajectoryDataset:
+    # Random access to the episodes of a dataset directory written by TrajectoryRecorder. Episodes and operators are
+    # memory-mapped, so nothing is loaded into RAM until accessed; states are regenerated on demand by replaying the
+    # operators with a simulator of the problem (cached for the last simulator_cache_size problems).
+    def __init__(self, path, compact_states=False, simulator_cache_size=16):
+        self.path = path
+        self.compact_states = compact_states
+        self.simulators = LRUCache(simulator_cache_size)
+        self._domains = {}
+        self.refresh()
+
+    def refresh(self):
+        # Maps the episodes appended since the dataset was opened
+        self.operator_names = _read_jsonl(os.path.join(self.path, OPERATOR_NAMES_FILE))
+        self.problems = _read_jsonl(os.path.join(self.path, PROBLEMS_FILE))
+        self.episodes = self._memmap(EPISODES_FILE, EPISODE_DTYPE)
+        self.operators = self._memmap(OPERATORS_FILE, np.int32)
+
+    def _memmap(self, file, dtype):
+        path = os.path.join(self.path, file)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(os.path.getsize(path) // np.dtype(dtype).itemsize,))
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def get_episode(self, i):
+        # (problem id, operator ids) of episode i
+        problem, start, length = self.episodes[i]
+        return int(problem), self.operators[start:start + length]
+
+    def get_transition_index(self, t):
+        # (episode, step) of the t-th transition of the dataset
+        i = int(np.searchsorted(self.episodes["start"], t, side="right")) - 1
+        return i, t - int(self.episodes["start"][i])
+
+    def get_problem(self, problem_id):
+        identity = self.problems[problem_id]
+        if "pddl_files" in identity:
+            return parse_problem(*identity["pddl_files"])
+        domain_file = identity["domain_file"]
+        if domain_file not in self._domains:
+            self._domains[domain_file] = parse_domain(domain_file)
+        domain = self._domains[domain_file]
+        objects = {o: domain.types[t] for o, t in identity["objects"].items()}
+
+        def to_predicate(atom):
+            name, params = to_tuple(atom)
+            return Predicate(name, [(o, objects[o]) for o in params])
+
+        problem = Problem(identity["name"], domain, objects,
+                          [to_predicate(a) for a in identity["init"]], [to_predicate(a) for a in identity["goal"]])
+        problem.objects_by_type = get_objects_by_type(problem)
+        return problem
+
+    def get_simulator(self, problem_id):
+        simulator = self.simulators.get(problem_id)
+        if simulator is None:
+            simulator = get_problem_simulator(self.get_problem(problem_id), compact_states=self.compact_states)
+            self.simulators.put(problem_id, simulator)
+        return simulator
+
+    def replay(self, i, max_steps=None):
+        # Yields the simulator states of episode i, from the initial state (len(operators) + 1 states)
+        problem_id, operators = self.get_episode(i)
+        simulator = self.get_simulator(problem_id)
+        state = simulator.reset()
+        yield state
+        for operator_id in operators[:max_steps].tolist():
+            if operator_id >= 0:
+                state = simulator.apply(state, self.operator_names[operator_id])
+            yield state
+
+    def get_state(self, i, step):
+        # Simulator state of episode i after step operators
+        for state in self.replay(i, max_steps=step):
+            pass
+        return state
+
+    def get_atoms(self, i, step):
+        return self.get_simulator(self.get_episode(i)[0]).get_atoms(self.get_state(i, step))
+
+    def get_observations(self, i, env):
+        # Rendered observations of all the states of episode i, with the representation and renderer of a PDDLGridEnv
+        problem_id, _ = self.get_episode(i)
+        simulator = self.get_simulator(problem_id)
+        observations = []
+        for state in self.replay(i):
+            grid_state = env.representation.get_gridstate(simulator.problem, simulator.get_atoms(state))
+            observations.append(env.render_gridstate(grid_state))
+        return np.stack(observations)
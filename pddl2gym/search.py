@@ -0,0 +1,215 @@
+from pddl2gym.simulator import SuccessorGenerator
+from pddl2gym.encoding import StateEncoder
+from array import array
+import numpy as np
+import heapq
+import time
+
+
+class GroundedTask:
+    # Compact view of the grounded task of a PDDLProblemSimulator for search: states are int bitmasks (see
+    # StateEncoder) and operators are (add, delete) masks indexed by operator id, with applicability given by a
+    # successor generator over bits
+    def __init__(self, simulator):
+        self.simulator = simulator
+        operators = list(simulator.operators.values())
+        if simulator.compact_states:
+            self.encoder = simulator.encoder
+            self.successor_generator = simulator.successor_generator
+        else:
+            self.encoder = StateEncoder(simulator.task.facts)
+            self.successor_generator = SuccessorGenerator(operators, self.encoder)
+        self.effects = [(self.encoder.encode(op.add_effects), self.encoder.encode(op.del_effects)) for op in operators]
+        self.initial_state = self.encoder.encode(simulator.task.initial_state)
+        self.goal = self.encoder.encode(simulator.task.goals)
+
+    def encode(self, state):
+        # Simulator state to int bitmask
+        return state if self.simulator.compact_states else self.encoder.encode(state)
+
+    def is_goal(self, state):
+        return state & self.goal == self.goal
+
+    def successors(self, state):
+        for i in self.successor_generator.get_applicable(state):
+            add, delete = self.effects[i]
+            yield i, (state & ~delete) | add
+
+    def get_plan(self, operator_ids):
+        return [self.simulator.operator_keys[i] for i in operator_ids]
+
+
+def blocks_heuristic(task):
+    # Admissible and consistent heuristic for Blocks: every block whose goal position ((on x y) / (ontable x)) is not
+    # satisfied has to be picked up and placed (2 actions), or only placed if it is being held (1 action)
+    fact_ids = task.encoder.fact_ids
+    atom_table = task.simulator.atom_table
+    goal_blocks = []
+    for fact in task.simulator.task.goals:
+        name, params = atom_table.parse(fact)
+        if name in ("on", "ontable"):
+            holding = fact_ids.get(f"(holding {params[0]})")
+            goal_blocks.append((1 << fact_ids[fact], 0 if holding is None else 1 << holding))
+
+    def h(state):
+        value = 0
+        for goal_bit, holding_bit in goal_blocks:
+            if not state & goal_bit:
+                value += 1 if state & holding_bit else 2
+        return value
+    return h
+
+
+def _stats(expanded, generated, start):
+    elapsed = time.perf_counter() - start
+    return {"expanded": expanded,
+            "generated": generated,
+            "time": elapsed,
+            "nodes_per_sec": expanded / elapsed if elapsed > 0 else float("inf")}
+
+
+def _extract_plan(task, parents, parent_ops, state_id):
+    ops = []
+    while parents[state_id] >= 0:
+        ops.append(parent_ops[state_id])
+        state_id = parents[state_id]
+    return task.get_plan(reversed(ops))
+
+
+def breadth_first_search(simulator, initial_state=None):
+    # Returns (plan, stats): an optimal plan as a list of operator keys (see PDDLProblemSimulator.operators), or None
+    # if the goal is unreachable. States are stored once in a list that also acts as the queue.
+    start = time.perf_counter()
+    task = GroundedTask(simulator)
+    s0 = task.initial_state if initial_state is None else task.encode(initial_state)
+    states = [s0]
+    ids = {s0: 0}
+    parents = array("l", [-1])
+    parent_ops = array("l", [-1])
+    generated = 1
+
+    expanded = 0
+    while expanded < len(states):
+        state = states[expanded]
+        if task.is_goal(state):
+            return _extract_plan(task, parents, parent_ops, expanded), _stats(expanded, generated, start)
+        for op, succ in task.successors(state):
+            generated += 1
+            if succ not in ids:
+                ids[succ] = len(states)
+                states.append(succ)
+                parents.append(expanded)
+                parent_ops.append(op)
+        expanded += 1
+    return None, _stats(expanded, generated, start)
+
+
+def astar_search(simulator, heuristic=None, initial_state=None):
+    # A* with unit costs. heuristic(task) returns a function from int states to estimates (default: blocks_heuristic)
+    start = time.perf_counter()
+    task = GroundedTask(simulator)
+    h = (heuristic or blocks_heuristic)(task)
+    s0 = task.initial_state if initial_state is None else task.encode(initial_state)
+    states = [s0]
+    ids = {s0: 0}
+    g = array("l", [0])
+    parents = array("l", [-1])
+    parent_ops = array("l", [-1])
+    closed = bytearray(1)
+    open_list = [(h(s0), 0, 0)]  # (f, -g, state id): ties broken in favour of deeper nodes
+    expanded = generated = 0
+
+    while open_list:
+        _, _, state_id = heapq.heappop(open_list)
+        if closed[state_id]:
+            continue
+        closed[state_id] = 1
+        state = states[state_id]
+        if task.is_goal(state):
+            return _extract_plan(task, parents, parent_ops, state_id), _stats(expanded, generated, start)
+        expanded += 1
+        g_succ = g[state_id] + 1
+        for op, succ in task.successors(state):
+            generated += 1
+            succ_id = ids.get(succ)
+            if succ_id is None:
+                succ_id = ids[succ] = len(states)
+                states.append(succ)
+                g.append(g_succ)
+                parents.append(state_id)
+                parent_ops.append(op)
+                closed.append(0)
+            elif g_succ < g[succ_id]:
+                g[succ_id] = g_succ
+                parents[succ_id] = state_id
+                parent_ops[succ_id] = op
+                closed[succ_id] = 0
+            else:
+                continue
+            heapq.heappush(open_list, (g_succ + h(succ), -g_succ, succ_id))
+    return None, _stats(expanded, generated, start)
+
+
+class StateSpace:
+    # Reachable state space of a problem. State i is states[i] (int bitmask, see GroundedTask); transitions are given
+    # as parallel arrays (source id, operator id, target id), sorted by source id.
+    def __init__(self, task, states, sources, operators, targets, stats):
+        self.task = task
+        self.states = states
+        self.ids = {s: i for i, s in enumerate(states)}
+        self.sources = np.asarray(sources, dtype=np.int32)
+        self.operators = np.asarray(operators, dtype=np.int32)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.is_goal = np.array([task.is_goal(s) for s in states], dtype=bool)
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.states)
+
+    def goal_distances(self):
+        # Optimal number of steps from every state to the goal (-1 if unreachable), by backwards breadth-first search
+        # from the goal states over the transitions
+        order = np.argsort(self.targets, kind="stable")
+        predecessors = self.sources[order].tolist()
+        offsets = np.searchsorted(self.targets[order], np.arange(len(self.states) + 1)).tolist()
+
+        distances = np.full(len(self.states), -1, dtype=np.int32)
+        frontier = np.flatnonzero(self.is_goal).tolist()
+        distances[frontier] = 0
+        d = 0
+        while frontier:
+            d += 1
+            next_frontier = []
+            for target in frontier:
+                for source in predecessors[offsets[target]:offsets[target+1]]:
+                    if distances[source] < 0:
+                        distances[source] = d
+                        next_frontier.append(source)
+            frontier = next_frontier
+        return distances
+
+
+def enumerate_states(simulator, initial_state=None, max_states=None):
+    # Breadth-first enumeration of all states reachable from the initial state. Raises if there are more than
+    # max_states states.
+    start = time.perf_counter()
+    task = GroundedTask(simulator)
+    s0 = task.initial_state if initial_state is None else task.encode(initial_state)
+    states = [s0]
+    ids = {s0: 0}
+    sources, operators, targets = array("l"), array("l"), array("l")
+
+    expanded = 0
+    while expanded < len(states):
+        for op, succ in task.successors(states[expanded]):
+            succ_id = ids.get(succ)
+            if succ_id is None:
+                if max_states is not None and len(states) >= max_states:
+                    raise Exception(f"More than {max_states} reachable states")
+                succ_id = ids[succ] = len(states)
+                states.append(succ)
+            sources.append(expanded)
+            operators.append(op)
+            targets.append(succ_id)
+        expanded += 1
+    return StateSpace(task, states, sources, operators, targets, _stats(expanded, len(targets) + 1, start))
@@ -1,21 +1,171 @@
-from pyperplan.grounding import ground, _get_partial_state
+from pyperplan.grounding import _get_partial_state, _get_statics
 from pyperplan.pddl.pddl import Predicate
+from pyperplan.task import Task
 from collections import defaultdict
-from pddl2gym.utils import to_tuple, to_string, get_objects_by_type
+import threading
+import queue
+import copy
+import os
+from pddl2gym.utils import to_tuple, to_string, get_objects_by_type, AtomTable, LRUCache
+from pddl2gym.encoding import StateEncoder
+from pddl2gym.cache import ground_cached
+from pddl2gym.pruning import prune_task
+
+
+class SuccessorGenerator:
+    # Decision tree over operator preconditions. Each node holds the operators whose preconditions have all been
+    # tested on the way down, plus a list of (fact, child) switches. Preconditions are tested in decreasing order of
+    # frequency, so a single membership test (e.g. handempty) discards whole groups of operators. If an encoder is
+    # given, switches test bits of compact (int) states instead of facts of frozenset states.
+    def __init__(self, operators, encoder=None):
+        frequency = defaultdict(int)
+        for op in operators:
+            for fact in op.preconditions:
+                frequency[fact] += 1
+        order = {fact: i for i, fact in enumerate(sorted(frequency, key=lambda f: (-frequency[f], f)))}
+        entries = [(sorted(op.preconditions, key=order.get), i) for i, op in enumerate(operators)]
+        self.encoder = encoder
+        self.root = self._build(entries, 0)
+        if encoder is not None:
+            self.get_applicable = self._get_applicable_compact
+
+    def _build(self, entries, depth):
+        immediate_ops = []
+        switches = {}
+        for preconditions, i in entries:
+            if len(preconditions) == depth:
+                immediate_ops.append(i)
+            else:
+                switches.setdefault(preconditions[depth], []).append((preconditions, i))
+        if self.encoder is not None:
+            return immediate_ops, [(1 << self.encoder.fact_ids[fact], self._build(e, depth + 1))
+                                   for fact, e in switches.items()]
+        return immediate_ops, [(fact, self._build(e, depth + 1)) for fact, e in switches.items()]
+
+    def get_applicable(self, state):
+        # Returns the (sorted) indices of the operators applicable in state
+        applicable = []
+        nodes = [self.root]
+        while nodes:
+            immediate_ops, switches = nodes.pop()
+            applicable.extend(immediate_ops)
+            for fact, child in switches:
+                if fact in state:
+                    nodes.append(child)
+        applicable.sort()
+        return applicable
+
+    def _get_applicable_compact(self, state):
+        applicable = []
+        nodes = [self.root]
+        while nodes:
+            immediate_ops, switches = nodes.pop()
+            applicable.extend(immediate_ops)
+            for bit, child in switches:
+                if state & bit:
+                    nodes.append(child)
+        applicable.sort()
+        return applicable
 
 
 class PDDLProblemSimulator:
-    def __init__(self, problem):
+    def __init__(self, problem, compact_states=False, remove_irrelevant_operators=True, prune=None):
+        # With compact_states, simulator states are int bitmasks over the grounded facts (see StateEncoder) instead
+        # of frozensets of atom strings. get_atoms() converts them back to atoms.
+        # prune can be "reachability" (drop operators and facts unreachable from the initial state) or "relevance"
+        # (also drop operators that cannot contribute to the goal, so the goal cannot be changed afterwards). The
+        # operator and fact counts before and after pruning are kept in self.pruning_stats (see pruning.prune_task).
+        assert prune in (None, "reachability", "relevance")
         self.problem = problem
-        self.task = ground(self.problem)
+        self.task = ground_cached(self.problem, remove_irrelevant_operators=remove_irrelevant_operators)
+        self.prune = prune
+        self.pruning_stats = None
+        if prune is not None:
+            self.task, self.pruning_stats = prune_task(self.task, relevance=prune == "relevance")
+        self.atom_table = AtomTable(self.task.facts)
+        self.problem.atom_table = self.atom_table  # available to representations, like problem.objects_by_type
         self.operators = {to_tuple(op.name): op for op in self.task.operators}
+        self._operator_keys = {op.name: k for k, op in self.operators.items()}
+        self.operator_keys = list(self.operators)  # operator id -> key of self.operators
+        self._operator_indices = {k: i for i, k in enumerate(self.operator_keys)}
+        self.compact_states = compact_states
+        if compact_states:
+            self.encoder = StateEncoder(self.task.facts)
+            self._compact_operators = {k: (self.encoder.encode(op.preconditions),
+                                           self.encoder.encode(op.add_effects),
+                                           self.encoder.encode(op.del_effects)) for k, op in self.operators.items()}
+            self._goal_mask = self.encoder.encode(self.task.goals)
+            self.successor_generator = SuccessorGenerator(list(self.operators.values()), self.encoder)
+        else:
+            self.successor_generator = SuccessorGenerator(list(self.operators.values()))
+        self._goal_effects = None
+        self._fact_encoder = self.encoder if compact_states else None
+        self.states_changed = False  # see with_states
+
+    @classmethod
+    def from_template(cls, problem, template):
+        # Simulator of problem that shares the grounded operators of template (and everything built from them:
+        # successor generator, encoder, atom table). template must have been grounded without relevance analysis,
+        # which depends on the goal, for a problem with the same domain, objects and static facts. Only the initial
+        # state and goals are computed. Returns None if a goal fact is not among the grounded facts.
+        facts = template.task.facts
+        goals = _get_partial_state(problem.goal)
+        if not goals <= facts:
+            return None
+        problem.objects.update(problem.domain.constants)  # as done by pyperplan's ground()
+        problem.atom_table = template.atom_table
+        init = _get_partial_state(problem.initial_state) & facts
+        simulator = copy.copy(template)
+        simulator.problem = problem
+        simulator.task = Task(problem.name, facts, init, goals, template.task.operators)
+        if simulator.compact_states:
+            simulator._goal_mask = simulator.encoder.encode(goals)
+        simulator._goal_effects = None
+        return simulator
+
+    def with_states(self, init, goals):
+        # Simulator of the same grounded problem with another initial state and goal, given as sets of grounded facts
+        # or, with compact_states, as int bitmasks (e.g. sampled by pddl2gym.random_blocks). Everything else is shared
+        # with self, as in from_template, including self.problem, whose PDDL initial state and goal are not updated:
+        # the problem is marked with has_state_variants, and the simulator with states_changed, so that the identity of
+        # the problem is taken from the task of the simulator (see recorder.get_problem_identity).
+        assert self.prune is None, "Initial states and goals cannot be changed after pruning"
+        self.problem.has_state_variants = True
+        simulator = copy.copy(self)
+        simulator.states_changed = True
+        if self.compact_states:
+            simulator._goal_mask = goals
+            init, goals = self.encoder.decode(init), self.encoder.decode(goals)
+        simulator.task = Task(self.task.name, self.task.facts, init, goals, self.task.operators)
+        simulator._goal_effects = None
+        return simulator
+
+    def get_encoder(self):
+        # StateEncoder over the grounded facts: the one of compact states, or one built on first use
+        if self._fact_encoder is None:
+            self._fact_encoder = StateEncoder(self.task.facts)
+        return self._fact_encoder
 
     def get_atoms(self, state):
+        if self.compact_states:
+            return self.encoder.decode(state)
         return state
 
     def reset(self):
+        if self.compact_states:
+            return self.encoder.encode(self.task.initial_state)
         return self.task.initial_state
 
+    def get_snapshot(self, state):
+        # Compact copy of a state: its packed fact bitmask as bytes (hashable and cheap to pickle)
+        encoder = self.get_encoder()
+        return encoder.to_bytes(state if self.compact_states else encoder.encode(state))
+
+    def restore_snapshot(self, snapshot):
+        encoder = self.get_encoder()
+        state = encoder.from_bytes(snapshot)
+        return state if self.compact_states else encoder.decode(state)
+
     def get_goal(self):
         return self.task.goals
 
@@ -23,27 +173,80 @@ class PDDLProblemSimulator:
         if type(g) is not list:
             g = [g]
         assert type(g[0]) is Predicate
+        assert self.prune != "relevance", "The goal cannot be changed after relevance pruning"
         self.task.goals = _get_partial_state(g)
+        if self.compact_states:
+            self._goal_mask = self.encoder.encode(self.task.goals)
+        self._goal_effects = None
 
-    def apply(self, state, action):
+    def _get_goal_effects(self):
+        # Operator key -> (goal facts added, goal facts deleted and not added), for the current goal
+        if self._goal_effects is None:
+            if self.compact_states:
+                g = self._goal_mask
+                self._goal_effects = {k: (add & g, delete & ~add & g)
+                                      for k, (_, add, delete) in self._compact_operators.items()}
+            else:
+                g = self.task.goals
+                self._goal_effects = {k: (op.add_effects & g, (op.del_effects - op.add_effects) & g)
+                                      for k, op in self.operators.items()}
+        return self._goal_effects
+
+    def get_goal_count(self, state):
+        # Number of goal facts satisfied in state
+        if self.compact_states:
+            return bin(state & self._goal_mask).count("1")
+        return len(self.task.goals & state)
+
+    def update_goal_count(self, state, action, count):
+        # Goal count of the state reached by applying action in state, given the goal count of state. Only the goal
+        # facts among the effects of the operator are checked, so the goal test of a trajectory is count == len(goal).
+        goal_add, goal_del = self._get_goal_effects()[self._get_operator_key(action)]
+        if not goal_add and not goal_del:
+            return count
+        if self.compact_states:
+            return count + bin(goal_add & ~state).count("1") - bin(goal_del & state).count("1")
+        return count + len(goal_add - state) - len(goal_del & state)
+
+    def _get_operator_key(self, action):
         if isinstance(action, str):  # Str action
-            action = to_tuple(action)
+            key = self._operator_keys.get(action)
+            return to_tuple(action) if key is None else key
+        return action
+
+    def get_operator(self, action):
+        action = self._get_operator_key(action)
         try:
-            op = self.operators[action]
+            return self.operators[action]
         except KeyError:
             raise Exception(f"Action {action} not in possible operators (grounded actions): {self.operators.keys()}")
+
+    def get_operator_index(self, action):
+        # Operator id: position of the operator in self.operators
+        return self._operator_indices[self._get_operator_key(action)]
+
+    def apply(self, state, action):
+        action = self._get_operator_key(action)
+        op = self.get_operator(action)
+        if self.compact_states:
+            pre, add, delete = self._compact_operators[action]
+            if state & pre != pre:
+                raise Exception(f"Action {action} not applicable in state {self.encoder.decode(state)}")
+            return (state & ~delete) | add
         if not op.applicable(state):
             raise Exception(f"Action {action} not applicable in state {state}")
         return op.apply(state)
 
     def goal_reached(self, state):
+        if self.compact_states:
+            return state & self._goal_mask == self._goal_mask
         return self.task.goal_reached(state)
 
     def get_applicable_actions(self, state):
         applicable_actions = defaultdict(list)
-        for (action, params), op in self.operators.items():
-            if op.applicable(state):
-                applicable_actions[action].append(params)
+        for i in self.successor_generator.get_applicable(state):
+            action, params = self.operator_keys[i]
+            applicable_actions[action].append(params)
         return applicable_actions
 
     def get_applicable_str_actions(self, state):
@@ -51,32 +254,162 @@ class PDDLProblemSimulator:
         return [to_string(a, params) for a, params_list in actions.items() for params in params_list]
 
 
+# Grounded problem simulators used as templates by get_problem_simulator, by (domain, objects, static facts)
+_templates = LRUCache(32)
+_templates_lock = threading.Lock()
+
+
+def _get_template_key(problem, compact_states):
+    domain = problem.domain
+    domain_file = getattr(domain, "pddl_file", None)
+    statics = _get_statics(domain.predicates.values(), domain.actions.values())
+    objects = dict(problem.objects, **domain.constants)
+    return (os.path.abspath(domain_file) if domain_file is not None else id(domain),
+            tuple(sorted((o, t.name) for o, t in objects.items())),
+            _get_partial_state([p for p in problem.initial_state if p.name in statics]),
+            compact_states)
+
+
+def get_problem_simulator(problem, compact_states=False):
+    # PDDLProblemSimulator that reuses the grounding of a previous problem with the same domain, objects and static
+    # facts, which may differ in its initial state and goals (see PDDLProblemSimulator.from_template). Otherwise, the
+    # problem is grounded (without relevance analysis) and kept as template for the next ones.
+    key = _get_template_key(problem, compact_states)
+    with _templates_lock:
+        template = _templates.get(key)
+    if template is not None:
+        simulator = PDDLProblemSimulator.from_template(problem, template)
+        if simulator is not None:
+            return simulator
+    simulator = PDDLProblemSimulator(problem, compact_states=compact_states, remove_irrelevant_operators=False)
+    with _templates_lock:
+        _templates.put(key, copy.copy(simulator))  # changes to the returned simulator do not affect later problems
+    return simulator
+
+
 class PDDLDomainSimulator:
-    def __init__(self, domain, problem_generator):
+    def __init__(self, domain, problem_generator, compact_states=False, prefetch=0, reuse_grounding=False,
+                 pool_size=8):
+        # If prefetch > 0, a background thread generates and grounds up to that many upcoming problems, so that
+        # reset() only takes a ready problem simulator from the queue. With reuse_grounding, problems over the same
+        # objects share their grounded operators (see get_problem_simulator). The simulators of the last pool_size
+        # problems are kept, so that snapshots of their states can be restored (see restore_snapshot). The generator
+        # can also yield PDDLProblemSimulators, which are used as they are. close() stops the prefetching thread.
         self.domain = domain
         self.problem_generator = problem_generator
+        self.compact_states = compact_states
+        self.reuse_grounding = reuse_grounding
         self.problem_id = -1
+        self.n_problems = 0
+        self.problem_simulators = LRUCache(pool_size)
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        if prefetch > 0:
+            self._queue = queue.Queue(maxsize=prefetch)
+            self._thread = threading.Thread(target=self._prefetch, daemon=True)
+            self._thread.start()
         self.reset()
 
+    def _next_problem_simulator(self):
+        problem = next(self.problem_generator)
+        if isinstance(problem, PDDLProblemSimulator):  # already grounded, e.g. see random_blocks.RandomBlocksSampler
+            assert problem.problem.domain is self.domain and problem.compact_states == self.compact_states
+            return problem
+        assert problem.domain is self.domain
+        problem.objects_by_type = get_objects_by_type(problem)
+        if self.reuse_grounding:
+            return get_problem_simulator(problem, compact_states=self.compact_states)
+        return PDDLProblemSimulator(problem, compact_states=self.compact_states)
+
+    def _prefetch(self):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(self._next_problem_simulator())
+            except BaseException as e:  # e.g. StopIteration, raised in reset()
+                self._queue.put(e)
+                return
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        # Stops the prefetching thread and drops the prefetched problems; later resets generate problems in the
+        # calling thread. Draining the queue unblocks the thread, which then puts at most one more problem and stops.
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._drain()
+        self._thread.join()
+        self._drain()
+        self._thread = self._queue = None
+
     @property
     def problem(self):
         return self.problem_simulator.problem
 
     def get_atoms(self, state):
-        return state[1]
+        return self.problem_simulator.get_atoms(state[1])
 
     def reset(self):
-        problem = next(self.problem_generator)
-        assert problem.domain is self.domain
-        problem.objects_by_type = get_objects_by_type(problem)
-        self.problem_simulator = PDDLProblemSimulator(problem)
+        if self._queue is None:
+            self.problem_simulator = self._next_problem_simulator()
+        else:
+            problem_simulator = self._queue.get()
+            if isinstance(problem_simulator, BaseException):
+                self._queue.put(problem_simulator)  # raise again in later resets
+                raise problem_simulator
+            self.problem_simulator = problem_simulator
         s = self.problem_simulator.reset()
-        self.problem_id += 1
+        self.problem_id = self.n_problems
+        self.n_problems += 1
+        self.problem_simulators.put(self.problem_id, self.problem_simulator)
         return (self.problem_id, s)
 
+    def get_snapshot(self, state):
+        # Problem id (4 bytes) followed by the packed state (see PDDLProblemSimulator.get_snapshot)
+        prob_id, s = state
+        assert prob_id == self.problem_id
+        return prob_id.to_bytes(4, "little") + self.problem_simulator.get_snapshot(s)
+
+    def restore_snapshot(self, snapshot):
+        # Makes the problem of the snapshot the current one (its simulator must still be in the pool)
+        prob_id = int.from_bytes(snapshot[:4], "little")
+        if prob_id != self.problem_id:
+            problem_simulator = self.problem_simulators.get(prob_id)
+            if problem_simulator is None:
+                raise Exception(f"Problem {prob_id} is no longer in the pool of problem simulators "
+                                f"(pool_size={self.problem_simulators.capacity})")
+            self.problem_simulator = problem_simulator
+            self.problem_id = prob_id
+        return (prob_id, self.problem_simulator.restore_snapshot(snapshot[4:]))
+
     def get_goal(self):
         return self.problem_simulator.get_goal()
 
+    def get_encoder(self):
+        return self.problem_simulator.get_encoder()
+
+    def get_goal_count(self, state):
+        prob_id, s = state
+        assert prob_id == self.problem_id
+        return self.problem_simulator.get_goal_count(s)
+
+    def update_goal_count(self, state, action, count):
+        prob_id, s = state
+        assert prob_id == self.problem_id
+        return self.problem_simulator.update_goal_count(s, action, count)
+
+    def get_operator(self, action):
+        return self.problem_simulator.get_operator(action)
+
+    def get_operator_index(self, action):
+        return self.problem_simulator.get_operator_index(action)
+
     def apply(self, state, action):
         prob_id, s = state
         assert prob_id == self.problem_id
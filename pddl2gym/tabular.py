@@ -0,0 +1,227 @@
+from pddl2gym.env import PDDLGridEnv
+from pddl2gym.search import enumerate_states
+from pddl2gym.simulator import PDDLProblemSimulator
+from pddl2gym.encoding import StateEncoder
+from pddl2gym.cache import get_cache_path
+import numpy as np
+import tempfile
+import hashlib
+import shutil
+import os
+
+
+TABULAR_FORMAT_VERSION = 1
+
+
+class TabularModel:
+    # Reachable state space of a problem under the reduced actions of a representation, as NumPy arrays. State 0 is
+    # the initial state; states are stored as packed fact bitmasks (see StateEncoder.to_bytes).
+    #   transitions[i, a]: state reached by reduced action a from state i (i itself if the action is None)
+    #   operators[i, a]: id of the grounded operator of reduced action a in state i (-1 if None)
+    #   goals[i]: whether state i is a goal state
+    #   observations[i]: rendered observation of state i (optional)
+    #   action_masks[i, a]: whether reduced action a is not None in state i (not saved, computed from operators)
+    # operators and action_masks are read-only, as rows of them are returned in env infos.
+    ARRAYS = ("states", "transitions", "operators", "goals")
+
+    def __init__(self, states, transitions, operators, goals, observations=None):
+        self.states = states
+        self.transitions = transitions
+        self.operators = operators
+        self.goals = goals
+        self.observations = observations
+        self.action_masks = operators >= 0
+        self.operators.setflags(write=False)
+        self.action_masks.setflags(write=False)
+
+    def __len__(self):
+        return len(self.states)
+
+    @classmethod
+    def build(cls, simulator, representation, max_states=None):
+        state_space = enumerate_states(simulator, max_states=max_states)
+        task = state_space.task
+        n_actions = representation.get_n_actions(simulator.problem)
+
+        transitions = np.empty((len(state_space), n_actions), dtype=np.int32)
+        operators = np.full((len(state_space), n_actions), -1, dtype=np.int32)
+        for i, state in enumerate(state_space.states):
+            atoms = task.encoder.decode(state)
+            for a, action in enumerate(representation.get_reduced_actions(simulator.problem, atoms)):
+                if action is None:
+                    transitions[i, a] = i
+                else:
+                    op = simulator.get_operator_index(action)
+                    add, delete = task.effects[op]
+                    transitions[i, a] = state_space.ids[(state & ~delete) | add]
+                    operators[i, a] = op
+
+        states = np.array([np.frombuffer(task.encoder.to_bytes(s), dtype=np.uint8) for s in state_space.states])
+        return cls(states, transitions, operators, state_space.is_goal)
+
+    def render_observations(self, simulator, representation, render):
+        # render(grid_state) -> observation array
+        encoder = _get_encoder(simulator)
+        observations = None
+        for i, packed in enumerate(self.states):
+            atoms = encoder.decode(encoder.from_bytes(packed.tobytes()))
+            obs = render(representation.get_gridstate(simulator.problem, atoms))
+            if observations is None:
+                observations = np.empty((len(self),) + obs.shape, dtype=obs.dtype)
+            observations[i] = obs
+        self.observations = observations
+
+    def step(self, state_ids, actions):
+        # Vectorized step: arrays of state ids and reduced action indices to next state ids, rewards and dones
+        next_ids = self.transitions[state_ids, actions]
+        dones = self.goals[next_ids] & (self.operators[state_ids, actions] >= 0)
+        return next_ids, dones.astype(np.float32), dones
+
+    def save(self, path):
+        # One .npy file per array, written to a temporary directory (unique per call) that is then renamed
+        tmp_path = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        if self.observations is not None:
+            np.save(os.path.join(tmp_path, "observations.npy"), self.observations)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # Arrays are memory-mapped, so processes loading the same model share its pages
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}
+        observations_path = os.path.join(path, "observations.npy")
+        if os.path.exists(observations_path):
+            arrays["observations"] = np.load(observations_path, mmap_mode="r")
+        return cls(**arrays)
+
+
+def _get_encoder(simulator):
+    # Same encoding as the one used by enumerate_states
+    return simulator.encoder if simulator.compact_states else StateEncoder(simulator.task.facts)
+
+
+def get_model_key(simulator, representation):
+    task = simulator.task
+    h = hashlib.sha256(f"v{TABULAR_FORMAT_VERSION}".encode())
+    h.update(f"{type(representation).__name__} {representation.get_n_actions(simulator.problem)}".encode())
+    for atoms in (sorted(task.facts), sorted(task.initial_state), sorted(task.goals),
+                  [op.name for op in simulator.operators.values()]):
+        h.update("\n".join(atoms).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def get_tabular_model(simulator, representation, max_states=None, render=None):
+    # Loads the model of the problem from the disk cache, or builds (and caches) it. If render is given,
+    # observations are rendered and cached too.
+    path = get_cache_path("tabular", get_model_key(simulator, representation), extension="")
+    model = None
+    if path is not None and os.path.exists(path):
+        model = TabularModel.load(path)
+    if model is None:
+        model = TabularModel.build(simulator, representation, max_states)
+    elif render is None or model.observations is not None:
+        return model
+
+    if render is not None:
+        model.render_observations(simulator, representation, render)
+    if path is not None:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            model.save(path)
+        except OSError:
+            pass
+    return model
+
+
+class TabularPDDLGridEnv(PDDLGridEnv):
+    # PDDLGridEnv whose states are ids of a precomputed TabularModel: stepping is an array lookup, with no grounded
+    # operator application nor representation work. Observations are precomputed too if render_observations is True
+    # (the frames of all reachable states are kept on disk, so only for small problems). Only supports
+    # PDDLProblemSimulators, as the model is built for a single problem (so not e.g. random column problems).
+    # Methods that need the facts of a state (get_tensor, get_achieved_goal) rebuild them from the model.
+    def __init__(self, simulator, representation, render_observations=False, max_states=None, **kwargs):
+        assert isinstance(simulator, PDDLProblemSimulator)
+        self.model = get_tabular_model(simulator, representation, max_states)
+        self.encoder = _get_encoder(simulator)
+        super(TabularPDDLGridEnv, self).__init__(simulator, representation, **kwargs)
+        if render_observations and self.model.observations is None:
+            self.model = get_tabular_model(simulator, representation, max_states,
+                                           render=lambda grid_state: self.world.render(grid_state, size=self.pixel_size))
+
+    def get_init_state(self):
+        if not hasattr(self, "_goal_obs"):
+            self._goal_obs = self._get_goal_obs()
+        return {"state_id": 0}
+
+    def get_next_state(self, state, action):
+        assert np.issubdtype(type(action), np.integer), "Tabular environments only accept reduced action indices"
+        # The info has the action mask and operator ids of the next state, as in PDDLGridEnv
+        i = state["state_id"]
+        if not self.model.action_masks[i, action]:
+            info = self._get_action_info(i)
+            info["invalid_action"] = True
+            return state, 0.0, False, info
+        next_id = int(self.model.transitions[i, action])
+        done = bool(self.model.goals[next_id])
+        return {"state_id": next_id}, float(done), done, self._get_action_info(next_id)
+
+    def _get_action_info(self, state_id):
+        return {"action_mask": self.model.action_masks[state_id], "operator_ids": self.model.operators[state_id]}
+
+    def get_simulator_state(self, state):
+        s = self.encoder.from_bytes(self.model.states[state["state_id"]].tobytes())
+        return s if self.simulator.compact_states else self.encoder.decode(s)
+
+    def get_tensor(self, state=None, out=None, one_hot=False):
+        if state is None:
+            state = self._state["state"]
+        atoms = self.simulator.get_atoms(self.get_simulator_state(state))
+        return self.representation.get_tensor(self.simulator.problem, atoms, out=out, one_hot=one_hot)
+
+    def get_achieved_goal(self, state=None):
+        # The model states are packed over the same facts as encode_atoms (see _get_encoder)
+        if state is None:
+            state = self._state["state"]
+        return np.array(self.model.states[state["state_id"]])
+
+    def get_gridstate(self, state):
+        grid_state = self.gridstate_cache.get(state["state_id"])
+        if grid_state is None:
+            atoms = self.simulator.get_atoms(self.get_simulator_state(state))
+            grid_state = self.representation.get_gridstate(self.simulator.problem, atoms)
+            self.gridstate_cache.put(state["state_id"], grid_state)
+        return grid_state
+
+    def get_observation(self, state=None):
+        if state is None:
+            state = self._state["state"]
+        if self.model.observations is not None:
+            return self.model.observations[state["state_id"]]
+        obs = self.render_cache.get(state["state_id"])
+        if obs is None:
+            obs = self.render_gridstate(self.get_gridstate(state), state["state_id"])
+        return obs
+
+    def get_indexed_actions(self, state=None):
+        if state is None:
+            state = self._state["state"]
+        return [None if op < 0 else self.simulator.operator_keys[op] for op in self.model.operators[state["state_id"]]]
+
+    def get_action_mask(self, state=None):
+        if state is None:
+            state = self._state["state"]
+        return self.model.action_masks[state["state_id"]]
+
+    def get_operator_ids(self, state=None):
+        if state is None:
+            state = self._state["state"]
+        return self.model.operators[state["state_id"]]
+
+    def get_applicable_actions(self, state=None):
+        if state is None:
+            state = self._state["state"]
+        return self.simulator.get_applicable_actions(self.get_simulator_state(state))
@@ -1,4 +1,6 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from functools import lru_cache
+import json
 import os
 from pyperplan.pddl.parser import Parser
 
@@ -7,7 +9,9 @@ def parse_domain(domain_file, path=None):
     if path is not None:
         domain_file = os.path.join(path, domain_file)
     parser = Parser(domain_file, probFile=None)
-    return parser.parse_domain()
+    domain = parser.parse_domain()
+    domain.pddl_file = domain_file  # used as key of the grounding templates (see simulator.get_problem_simulator)
+    return domain
 
 
 def parse_problem(domain_file, problem_file, path=None):
@@ -16,8 +20,10 @@ def parse_problem(domain_file, problem_file, path=None):
         problem_file = os.path.join(path, problem_file)
     parser = Parser(domain_file, problem_file)
     domain = parser.parse_domain()
+    domain.pddl_file = domain_file
     problem = parser.parse_problem(domain)  # domain can be found as an attribute of problem
     problem.objects_by_type = get_objects_by_type(problem)
+    problem.pddl_files = (domain_file, problem_file)  # used as key of the grounding cache
     return problem
 
 
@@ -27,6 +33,23 @@ def to_tuple(str_predicate):
     return res[0], tuple(res[1:])
 
 
+class AtomTable:
+    # Interned atoms of a grounded problem: maps each fact string to its parsed (name, params) tuple, and lists the
+    # params of the facts of each predicate. Lookups replace to_tuple on the hot paths.
+    def __init__(self, facts):
+        self.parsed = {f: to_tuple(f) for f in sorted(facts)}
+        by_predicate = defaultdict(list)
+        for name, params in self.parsed.values():
+            by_predicate[name].append(params)
+        self.by_predicate = dict(by_predicate)
+
+    def parse(self, atom):
+        parsed = self.parsed.get(atom)
+        if parsed is None:  # not a grounded fact, e.g. an atom deduced by a representation
+            return to_tuple(atom)
+        return parsed
+
+
 def to_string(p, params=None):
     if params is None:
         p, params = p
@@ -41,10 +64,11 @@ def get_objects_by_type(problem):
     return {k: sorted(v) for k, v in d.items()}
 
 
-def to_atoms_dict(atoms):
+def to_atoms_dict(atoms, atom_table=None):
+    parse = to_tuple if atom_table is None else atom_table.parse
     atoms_dict = defaultdict(list)
     for a in atoms:
-        name, params = to_tuple(a)
+        name, params = parse(a)
         atoms_dict[name].append(params)
     return dict(atoms_dict)
 
@@ -57,5 +81,71 @@ def get_atom_fixed_param(atoms, name, param_idx, param_value):
     return None
 
 
+class LRUCache:
+    # Bounded mapping that evicts the least recently used entry. A capacity of 0 disables it.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_stats(self):
+        return {"size": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
 def files_in_dir(path):
-    return next(os.walk(path))[2]
\ No newline at end of file
+    return next(os.walk(path))[2]
+
+PACKAGE_DIR = os.path.dirname(__file__)
+MANIFEST_PATH = os.path.join(PACKAGE_DIR, "envs.json")
+
+
+@lru_cache(maxsize=None)
+def _read_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def load_manifest(module_name):
+    # Environment specs of a module, as generated by pddl2gym.manifest. None if the manifest has not been generated.
+    return _read_manifest().get(module_name)
+
+
+def register_env_specs(specs):
+    # specs: {env_id: {"entry_point": ..., "kwargs": ...}}, with file kwargs relative to the package directory
+    import gym
+    registered_envs = {}
+    for env_id, spec in specs.items():
+        kwargs = {k: os.path.join(PACKAGE_DIR, v) if k.endswith("_file") else v for k, v in spec["kwargs"].items()}
+        try:
+            gym.register(id=env_id,
+                         entry_point=spec["entry_point"],
+                         nondeterministic=False,
+                         kwargs=kwargs)
+            registered_envs[env_id] = (kwargs["domain_file"], kwargs.get("instance_file"))
+        except gym.error.Error:
+            pass
+    return registered_envs
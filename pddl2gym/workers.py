@@ -0,0 +1,172 @@
+from pddl2gym.simulator import PDDLDomainSimulator
+from pddl2gym.encoding import StateEncoder
+import multiprocessing as mp
+import numpy as np
+import traceback
+import random
+
+
+class RolloutWorkerPool:
+    # Collects transitions from several simulators in parallel processes. The simulators are created (parsed and
+    # grounded) by the caller before the pool forks its workers, so workers share them copy-on-write instead of
+    # grounding again. Each worker owns a subset of the simulators and writes its transitions into shared-memory NumPy
+    # buffers, with states packed as fact bitmasks (see StateEncoder.to_bytes) over the facts of their problem.
+    #
+    # policy(simulator, state, rng) returns the action to apply, or None for a uniformly random applicable action.
+    # For PDDLDomainSimulators, the problem simulator of the current episode is passed. Exceptions raised in a worker
+    # (e.g. by the policy) are re-raised by collect(), with the traceback of the worker; the worker then exits.
+    def __init__(self, simulators, n_workers=None, n_steps=1000, max_episode_steps=100, policy=None, seed=0):
+        self.simulators = simulators
+        self.n_workers = n_workers or mp.cpu_count()
+        self.n_steps = n_steps
+        self.n_bytes = max(_get_problem_simulator(s).encoder.n_bytes if _get_problem_simulator(s).compact_states
+                           else StateEncoder(_get_problem_simulator(s).task.facts).n_bytes for s in simulators)
+
+        ctx = mp.get_context("fork")
+        shape = (self.n_workers, n_steps)
+        self.buffers = {"simulator_idx": _shared_array(ctx, shape, np.int32),
+                        "problem_id": _shared_array(ctx, shape, np.int32),
+                        "state": _shared_array(ctx, shape + (self.n_bytes,), np.uint8),
+                        "action": _shared_array(ctx, shape, np.int32),
+                        "reward": _shared_array(ctx, shape, np.float32),
+                        "done": _shared_array(ctx, shape, np.bool_),
+                        "next_state": _shared_array(ctx, shape + (self.n_bytes,), np.uint8)}
+
+        self.connections = []
+        self.processes = []
+        for w in range(self.n_workers):
+            simulator_idxs = list(range(w, len(simulators), self.n_workers)) or [w % len(simulators)]
+            parent_conn, child_conn = ctx.Pipe()
+            p = ctx.Process(target=_worker,
+                            args=(w, simulators, simulator_idxs, self.buffers, child_conn, n_steps, max_episode_steps,
+                                  policy, seed + w),
+                            daemon=True)
+            p.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(p)
+
+    def collect(self):
+        # Runs n_steps transitions in every worker. Returns a dict of arrays with n_workers*n_steps transitions each:
+        # simulator_idx, problem_id, state, action (operator id, see PDDLProblemSimulator.operator_keys), reward, done
+        # (episode ended by reaching the goal or max_episode_steps) and next_state.
+        for conn in self.connections:
+            try:
+                conn.send("collect")
+            except OSError:
+                pass  # the worker has exited, its error is received below
+        errors = []
+        for w, conn in enumerate(self.connections):
+            try:
+                error = conn.recv()  # None, or the traceback of the exception raised in the worker
+            except (EOFError, OSError):
+                error = "exited (after an earlier error)"
+            if error is not None:
+                errors.append(f"Worker {w}: {error}")
+        if errors:
+            raise Exception("Rollout workers failed:\n" + "\n".join(errors))
+        return {k: v.reshape((-1,) + v.shape[2:]).copy() for k, v in self.buffers.items()}
+
+    def close(self):
+        # Also works if workers have exited (e.g. after an error)
+        for conn in self.connections:
+            try:
+                conn.send("close")
+            except OSError:
+                pass
+            conn.close()
+        for p in self.processes:
+            p.join()
+        self.connections, self.processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _shared_array(ctx, shape, dtype):
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray("B", int(np.prod(shape)) * dtype.itemsize)
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _get_problem_simulator(simulator):
+    if isinstance(simulator, PDDLDomainSimulator):
+        return simulator.problem_simulator
+    return simulator
+
+
+def _worker(worker_id, simulators, simulator_idxs, buffers, conn, n_steps, max_episode_steps, policy, seed):
+    for simulator in simulators:
+        if isinstance(simulator, PDDLDomainSimulator):
+            simulator.close()  # prefetching threads do not survive the fork, problems are generated in the worker
+    try:
+        _collect(worker_id, simulators, simulator_idxs, buffers, conn, n_steps, max_episode_steps, policy, seed)
+    except Exception:
+        conn.send(traceback.format_exc())
+    conn.close()
+
+
+def _collect(worker_id, simulators, simulator_idxs, buffers, conn, n_steps, max_episode_steps, policy, seed):
+    rng = random.Random(seed)
+    buffers = {k: v[worker_id] for k, v in buffers.items()}
+    encoders = {}
+    episode = 0
+
+    def reset():
+        nonlocal episode
+        idx = simulator_idxs[episode % len(simulator_idxs)]
+        episode += 1
+        simulator = simulators[idx]
+        state = simulator.reset()
+        problem_id = 0
+        if isinstance(simulator, PDDLDomainSimulator):
+            problem_id, state = state
+        problem_simulator = _get_problem_simulator(simulator)
+        if problem_simulator.compact_states:
+            encoder = problem_simulator.encoder
+        else:
+            if (idx, problem_id) not in encoders:
+                encoders.clear()  # only keep the encoder of the current problem
+                encoders[(idx, problem_id)] = StateEncoder(problem_simulator.task.facts)
+            encoder = encoders[(idx, problem_id)]
+        return idx, problem_id, problem_simulator, encoder, state
+
+    def write(buffer, t, encoder, problem_simulator, state):
+        if not problem_simulator.compact_states:
+            state = encoder.encode(state)
+        packed = np.frombuffer(encoder.to_bytes(state), dtype=np.uint8)
+        buffer[t, :len(packed)] = packed
+        buffer[t, len(packed):] = 0
+
+    idx, problem_id, problem_simulator, encoder, state = reset()
+    steps = 0
+    while conn.recv() == "collect":
+        for t in range(n_steps):
+            action = None if policy is None else policy(problem_simulator, state, rng)
+            if action is None:
+                op_idx = rng.choice(problem_simulator.successor_generator.get_applicable(state))
+            else:
+                op_idx = problem_simulator.get_operator_index(action)
+            action = problem_simulator.operator_keys[op_idx]
+            next_state = problem_simulator.apply(state, action)
+            done = problem_simulator.goal_reached(next_state)
+            steps += 1
+
+            buffers["simulator_idx"][t] = idx
+            buffers["problem_id"][t] = problem_id
+            buffers["action"][t] = op_idx
+            buffers["reward"][t] = float(done)
+            write(buffers["state"], t, encoder, problem_simulator, state)
+            write(buffers["next_state"], t, encoder, problem_simulator, next_state)
+
+            if done or steps >= max_episode_steps:
+                buffers["done"][t] = True
+                idx, problem_id, problem_simulator, encoder, state = reset()
+                steps = 0
+            else:
+                buffers["done"][t] = False
+                state = next_state
+        conn.send(None)